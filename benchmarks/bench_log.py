@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Cost of the debug log while the device list is read (FritzBox.fetch_actors) from the fake FRITZ!Box,
+with Kodi debug logging off and on (block of display values or one line per device, see the setting
+compactLog), compared with the eager logging of version 0.0.27, which formatted and encoded 16
+messages per device regardless of the log level.
+
+    python benchmarks/bench_log.py [count ...]
+'''
+
+import os
+import sys
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), BENCHMARKS, os.path.dirname(BENCHMARKS)]
+
+REPEAT = 5
+
+
+def legacy_log(actors):
+
+    # per device log block and writeLog of version 0.0.27
+
+    import xbmc
+    from resources.lib.tools import addonID, addonVersion
+
+    def writeLog(message, level=xbmc.LOGDEBUG):
+        try:
+            xbmc.log('[%s %s] %s' % (addonID, addonVersion, message.encode('utf-8')), level)
+        except UnicodeDecodeError:
+            xbmc.log('[%s %s] %s' % (addonID, addonVersion, message), level)
+
+    for actor in actors:
+        writeLog('<<<<', xbmc.LOGDEBUG)
+        writeLog('----- current state of AIN %s -----' % (actor.actor_id))
+        writeLog('Name:          %s' % actor.name)
+        writeLog('Type:          %s' % actor.type)
+        writeLog('Presence:      %s' % actor.present)
+        writeLog('Device ID:     %s' % actor.device_id)
+        writeLog('Temperature:   %s' % actor.temperature)
+        writeLog('State:         %s' % actor.state)
+        writeLog('Icon:          %s' % actor.icon)
+        writeLog('Power:         %s' % actor.power)
+        writeLog('Consumption:   %s' % actor.energy)
+        writeLog('soll Temp.:    %s' % actor.set_temp)
+        writeLog('comfort Temp.: %s' % actor.comf_temp)
+        writeLog('lower Temp.:   %s' % actor.lowering_temp)
+        writeLog('Battery:       %s' % actor.battery)
+        writeLog('Battery low:   %s' % actor.batterylow)
+        writeLog('>>>>', xbmc.LOGDEBUG)
+
+
+def main(counts):
+    import xbmc
+    import xbmcaddon
+    from fakebox import FakeFritzBox
+    from resources.lib import tools
+    from resources.lib.fritzbox import FritzBox
+
+    print '%8s  %-22s %10s %10s' % ('devices', 'logging', 'time [ms]', 'messages')
+    for count in counts:
+        box = FakeFritzBox(count=count).start()
+        try:
+            xbmcaddon._settings.update(fbServer=box.address, fbUsername='admin', fbPasswd='secret')
+            fritz = FritzBox()
+            fritz.fetch_actors()
+
+            for name, debug, compact, legacy in (('debug off', False, 'false', False), ('debug on, block', True, 'false', False),
+                                                 ('debug on, compact', True, 'true', False), ('eager (0.0.27)', False, 'false', True)):
+                tools._debug = debug
+                xbmcaddon._settings['compactLog'] = compact
+                run = (lambda: legacy_log(fritz.fetch_actors())) if legacy else fritz.fetch_actors
+                xbmc.logs[0] = 0
+                run()
+                messages = xbmc.logs[0]
+                print '%8d  %-22s %10.2f %10d' % (count, name, min(timeit.repeat(run, number=1, repeat=REPEAT)) * 1000, messages)
+            for _box in fritz.boxes: _box.session.close()
+        finally:
+            box.stop()
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1:]] or [100, 1000])
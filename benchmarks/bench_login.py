@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Cost of a login (Box.login with an invalid SID: challenge request, response, new SID) against the fake
+FRITZ!Box with the MD5 challenge and with the PBKDF2 challenge of FRITZ!OS 7.24, the latter without
+and with the cached key of the first stage (see Box.pbkdf2Stage1). The fake box runs in the same
+process and checks the response with both stages, so the hash column reports the time the client
+spends on the response (Box.pbkdf2Response) on its own.
+
+    python benchmarks/bench_login.py [--iterations 10000 2000] [--repeat 5]
+'''
+
+import os
+import sys
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), BENCHMARKS, os.path.dirname(BENCHMARKS)]
+
+
+def main(args):
+    import time
+    import xbmcaddon
+    from fakebox import FakeFritzBox
+    from resources.lib.fritzbox import Box
+    from resources.lib.state import state
+
+    spent = [0.0]
+    pbkdf2Response = Box.pbkdf2Response
+
+    def timed(self, *args):
+        start = time.time()
+        try:
+            return pbkdf2Response(self, *args)
+        finally:
+            spent[0] += time.time() - start
+
+    Box.pbkdf2Response = timed
+
+    print 'PBKDF2 iterations %s/%s, best of %s logins' % (args.iterations[0], args.iterations[1], args.repeat)
+    print '%-24s %10s %10s %7s' % ('login', 'time [ms]', 'hash [ms]', 'trips')
+    for name, pbkdf2, cached in (('MD5', None, False), ('PBKDF2', tuple(args.iterations), False),
+                                 ('PBKDF2, cached stage 1', tuple(args.iterations), True)):
+        box = FakeFritzBox(count=1, pbkdf2=pbkdf2).start()
+        try:
+            xbmcaddon._settings.update(fbServer=box.address, fbUsername='admin', fbPasswd='secret')
+            state.update({'SID': '', 'fb_stage1': ''})
+            fritz = Box()
+            if cached: fritz.login()
+
+            def login():
+                if not cached: state.set('fb_stage1', '')
+                fritz.resetFbSession()
+                fritz.getSettings()
+                fritz.established = False
+                assert fritz.login()
+
+            box.reset()
+            login()
+            trips = box.count()
+            spent[0] = 0.0
+            elapsed = min(timeit.repeat(login, number=1, repeat=args.repeat))
+            print '%-24s %10.2f %10.2f %7d' % (name, elapsed * 1000, spent[0] / args.repeat * 1000, trips)
+            fritz.session.close()
+        finally:
+            box.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Cost of the MD5 and the PBKDF2 login')
+    parser.add_argument('--iterations', type=int, nargs=2, default=[10000, 2000], help='iterations of both PBKDF2 stages')
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Parse time and peak memory of the devicelist parser of FritzBox.fetch_box without snapshot (every
+device element is split from the raw response with resources.lib.fritzbox.splitdevices, hashed and
+parsed into a Device) compared with the tree based parser of version 0.0.27 (ElementTree.fromstring
+of the decoded response and Element.find for every attribute). The parser of 0.0.27 is measured with
+the pure Python ElementTree it used and with cElementTree, which fetch_box uses, so the gain of the
+C module and the gain of the parser are shown separately.
+
+    python benchmarks/bench_parse.py [count ...]
+
+Every measurement runs in a separate interpreter, peak memory is the growth of the maximum
+resident set size while parsing.
+'''
+
+import os
+import sys
+import resource
+import subprocess
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), os.path.dirname(BENCHMARKS)]
+
+from devicelist import devicelist
+
+REPEAT = 5
+
+
+def legacy_parse(text, ElementTree):
+
+    # device list handling of FritzBox.get_actors and Device.__init__ of version 0.0.27, ElementTree is the module
+
+    import re
+
+    actors = list()
+    for device in ElementTree.fromstring(text.encode('utf-8')):
+        bitmask = int(device.attrib['functionbitmask'])
+        actor = {'actor_id': device.attrib['identifier'], 'device_id': device.attrib['id'],
+                 'fwversion': device.attrib['fwversion'], 'productname': device.attrib['productname'],
+                 'manufacturer': device.attrib['manufacturer'], 'functionbitmask': bitmask,
+                 'name': device.find('name').text, 'present': int(device.find('present').text or '0'),
+                 'battery': 'n/a' if device.find('battery') is None else device.find('battery').text + '%',
+                 'batterylow': 0 if device.find('batterylow') is None else int(device.find('batterylow').text)}
+        if bitmask & 512:
+            actor['state'] = int(device.find('switch').find('state').text or '0')
+            actor['mode'] = device.find('switch').find('mode').text
+            actor['lock'] = int(device.find('switch').find('lock').text or '0')
+        if bitmask & 64:
+            actor['set_temp'] = int(device.find('hkr').find('tsoll').text or '0')
+            actor['comf_temp'] = int(device.find('hkr').find('komfort').text or '0')
+            actor['lowering_temp'] = int(device.find('hkr').find('absenk').text or '0')
+            actor['bin_slider'] = int(device.find('hkr').find('tsoll').text or '0')
+        if bitmask & 128:
+            actor['power'] = '{:0.2f}'.format(float(device.find('powermeter').find('power').text) / 1000) + ' W'
+            actor['energy'] = '{:0.2f}'.format(float(device.find('powermeter').find('energy').text) / 1000) + ' kWh'
+        if bitmask & 256:
+            actor['temperature'] = '{:0.1f}'.format(float(device.find('temperature').find('celsius').text) / 10)
+        if re.match('([A-F]|[0-9]){2}:([A-F]|[0-9]){2}:([A-F]|[0-9]){2}-([A-F]|[0-9]){3}', actor['actor_id']):
+            actor['type'] = 'group'
+        actors.append(actor)
+    return actors
+
+
+def split_parse(data):
+
+    # device list handling of FritzBox.fetch_box if no device is in the snapshot
+
+    import hashlib
+    from resources.lib.fritzbox import Device, etree, splitdevices
+
+    ET = etree()
+    devices = list()
+    for ain, element in splitdevices(data):
+        hashlib.md5(element).hexdigest()
+        devices.append(Device(ET.fromstring(element)))
+    return devices
+
+
+def measure(method, count):
+    data = devicelist(count)
+    from xml.etree import ElementTree, cElementTree
+
+    text = data.decode('utf-8')
+    if method == '0.0.27': run = lambda: legacy_parse(text, ElementTree)
+    elif method == '0.0.27 C': run = lambda: legacy_parse(text, cElementTree)
+    else: run = lambda: split_parse(data)
+
+    # import everything before the memory baseline is taken
+
+    split_parse(devicelist(1))
+    legacy_parse(devicelist(1).decode('utf-8'), ElementTree)
+    legacy_parse(devicelist(1).decode('utf-8'), cElementTree)
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    devices = run()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    assert len(devices) == count
+    del devices
+
+    seconds = min(timeit.repeat(run, number=1, repeat=REPEAT))
+    print '%f %d' % (seconds, peak)
+
+
+def main(counts):
+    print '%8s  %-10s %12s %14s' % ('devices', 'parser', 'time [ms]', 'peak mem [kB]')
+    for count in counts:
+        for method in ('0.0.27', '0.0.27 C', 'split'):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--measure', method, str(count)])
+            seconds, peak = output.split()
+            print '%8d  %-10s %12.2f %14s' % (count, method, float(seconds) * 1000, peak)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(count) for count in sys.argv[1:]] or [10, 100, 1000])
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Cost of a poll of the service (FritzBox.refresh: query the device list, parse it, publish the snapshot)
+against the fake FRITZ!Box, without fingerprints (every poll parses and publishes the whole device
+list), with one changed device (only its element is parsed) and with an
+unchanged device list (one request and one hash, nothing is parsed or published).
+
+    python benchmarks/bench_poll.py [count ...]
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), BENCHMARKS, os.path.dirname(BENCHMARKS)]
+
+PROFILE = os.environ.setdefault('FRITZACT_PROFILE', tempfile.mkdtemp(prefix='fritzact-poll-'))
+
+REPEAT = 5
+
+
+def main(counts):
+    import xbmcaddon
+    from fakebox import FakeFritzBox
+    from resources.lib import fritzbox
+    from resources.lib.fritzbox import FritzBox
+
+    parsed = [0]
+    Device = fritzbox.Device
+
+    class CountingDevice(Device):
+        __slots__ = ()
+
+        def __init__(self, element):
+            parsed[0] += 1
+            Device.__init__(self, element)
+
+    fritzbox.Device = CountingDevice
+
+    print '%8s  %-16s %10s %8s %10s' % ('devices', 'poll', 'time [ms]', 'parsed', 'published')
+    for count in counts:
+        box = FakeFritzBox(count=count).start()
+        try:
+            xbmcaddon._settings.update(fbServer=box.address, fbUsername='admin', fbPasswd='secret')
+            fritz = FritzBox()
+            fritz.refresh()
+            published = [0]
+            publish = fritz.snapshot.publish
+
+            def counted(*args, **kwargs):
+                published[0] += 1
+                return publish(*args, **kwargs)
+
+            fritz.snapshot.publish = counted
+            switch = [entry for entry in box.devices if 'state' in entry['values']][0]['values']
+
+            def full():
+                fritz.snapshot.read()['fingerprints'] = dict()
+                fritz.refresh()
+
+            def changed():
+                switch['state'] = 1 - switch['state']
+                fritz.refresh()
+
+            for name, poll in (('full', full), ('one changed', changed), ('unchanged', fritz.refresh)):
+                poll()
+                parsed[0] = published[0] = 0
+                elapsed = min(timeit.repeat(poll, number=1, repeat=REPEAT))
+                print '%8d  %-16s %10.2f %8d %10d' % (count, name, elapsed * 1000, parsed[0] // REPEAT, published[0] // REPEAT)
+            for _box in fritz.boxes: _box.session.close()
+        finally:
+            box.stop()
+    shutil.rmtree(PROFILE, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main([int(count) for count in sys.argv[1:]] or [100, 1000])
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+End-to-end scenarios of default.py against the fake FRITZ!Box (benchmarks/fakebox.py) with the
+recording Kodi stubs (benchmarks/stubs). Every run of a scenario is a script call in a new
+interpreter, as Kodi starts the addon. The first run of a scenario starts with an empty addon
+profile (cold), the following runs keep the profile, i.e. the SID and the snapshot (warm). The
+settings are the defaults of resources/settings.xml, the runs are separated by the debounce window,
+so a switch command of a run isn't merged with the one of the previous run.
+
+    python benchmarks/bench_scenarios.py [--runs 5] [--devices 20] [--latency 0.0] [--service] [scenario ...]
+
+With --service the background service (service.py) runs during every scenario, switch actions are
+forwarded to it (see resources/lib/ipc.py).
+
+Reported per scenario: wall time of the script, HTTP round trips to the fake box (login requests
+in brackets), allocations (growth of the gc-tracked objects while the script runs and of the
+maximum resident set size) and the recorded Kodi calls.
+'''
+
+import os
+import sys
+import json
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), BENCHMARKS, ROOT]
+
+# name, arguments of default.py and the scripted answers of the dialogs (see stubs/xbmcgui.py), {ts} is
+# replaced by the timestamp of the published snapshot as the skin does
+
+SCENARIOS = [
+    ('widget', ['plugin://script.program.fritzact/', '1', '?ts='], {}),
+    ('widget-reload', ['plugin://script.program.fritzact/', '1', '?ts={ts}'], {}),
+    ('toggle', ['default.py', 'action=toggle&ain=08761%200000000'], {}),
+    ('temp', ['default.py', 'action=temp&ain=09995%200000002'], {'actions': [2, 2, 7]}),
+    ('select', ['default.py', ''], {'select': [1]}),
+    ('setpreferredain', ['default.py', 'action=setpreferredain'], {'select': [1]}),
+    ('setreadonlyain', ['default.py', 'action=setreadonlyain'], {'multiselect': [[1, 2]]}),
+]
+
+# default debounce window of the switch commands (ms)
+
+DEBOUNCE = 300
+
+
+def environment(profile, box, service=False):
+    return dict(os.environ, FRITZACT_PROFILE=profile, FRITZACT_fbServer=box.address, FRITZACT_fbUsername='admin',
+                FRITZACT_fbPasswd='secret', FRITZACT_serviceEnabled=str(service).lower(),
+                FRITZACT_forwardCommands='true', PYTHONPATH=os.pathsep.join(sys.path[0:3]))
+
+
+def start_service(profile, env):
+
+    # start service.py and wait until the command server is listening
+
+    import subprocess
+
+    service = subprocess.Popen([sys.executable, os.path.join(ROOT, 'service.py')], env=env, cwd=ROOT)
+    for n in range(100):
+        try:
+            with open(os.path.join(profile, 'window-10000.json')) as handle:
+                if json.load(handle).get('fritzact.ipc'): return service
+        except (IOError, ValueError):
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('service did not start')
+
+
+def stop_service(profile, service):
+    open(os.path.join(profile, 'abort'), 'w').close()
+    service.wait()
+
+
+def timestamp(profile):
+    try:
+        with open(os.path.join(profile, 'addon_data', 'script.program.fritzact', 'devices.json')) as handle:
+            return str(json.load(handle)['timestamp'])
+    except (IOError, ValueError, KeyError):
+        return ''
+
+
+def run(name, argv):
+
+    # runs default.py in this interpreter and prints the measurements as JSON
+
+    import gc
+    import resource
+    import xbmc
+    import xbmcgui
+
+    xbmcgui.responses.update(json.loads(os.environ.get('FRITZACT_RESPONSES', '{}')))
+    sys.argv = argv
+    os.chdir(ROOT)
+
+    gc.collect()
+    objects = len(gc.get_objects())
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    try:
+        execfile(os.path.join(ROOT, 'default.py'), {'__name__': '__main__'})
+    except SystemExit:
+        pass
+    elapsed = time.time() - start
+
+    # wait for background threads (e.g. the refresh of a stale snapshot), they are part of the work
+
+    import threading
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon: thread.join()
+
+    print json.dumps({'ms': elapsed * 1000, 'objects': len(gc.get_objects()) - objects,
+                      'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss, 'logs': xbmc.logs[0],
+                      'calls': [call[0] for call in xbmc.calls]})
+
+
+def summary(calls):
+    counts = dict()
+    for call in calls:
+        if call not in ('xbmc.sleep', ): counts[call.split('.')[-1]] = counts.get(call.split('.')[-1], 0) + 1
+    return ', '.join('%s %s' % (count, call) for call, count in sorted(counts.items()))
+
+
+def main(args):
+    import shutil
+    import subprocess
+    import tempfile
+    from fakebox import FakeFritzBox
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenarios or scenario[0] in args.scenarios]
+    box = FakeFritzBox(count=args.devices, latency=args.latency).start()
+
+    print 'fake FRITZ!Box with %s devices on %s, latency %s ms, %s runs per scenario%s' % \
+          (args.devices, box.address, args.latency * 1000, args.runs, ', service running' if args.service else '')
+    print '%-16s %-5s %9s %7s %9s %9s  %s' % ('scenario', 'run', 'time [ms]', 'trips', 'objects', 'rss [kB]', 'kodi calls')
+    try:
+        for name, argv, responses in scenarios:
+            profile = tempfile.mkdtemp(prefix='fritzact-scenario-')
+            service = None
+            try:
+                env = environment(profile, box, args.service)
+                if args.service: service = start_service(profile, env)
+                env['FRITZACT_RESPONSES'] = json.dumps(responses)
+                results = list()
+                for n in range(args.runs):
+                    if n > 0: time.sleep(DEBOUNCE / 1000.0)
+                    box.reset()
+                    arguments = [argument.replace('{ts}', timestamp(profile)) for argument in argv]
+                    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', name] + arguments, env=env)
+                    result = json.loads(output.strip().splitlines()[-1])
+                    result['trips'], result['logins'] = box.count(), box.count(path='/login_sid.lua')
+                    results.append(result)
+
+                for label, selection in (('cold', results[:1]), ('warm', results[1:])):
+                    if not selection: continue
+                    result = sorted(selection, key=lambda result: result['ms'])[len(selection) // 2]
+                    print '%-16s %-5s %9.1f %7s %9d %9d  %s' % (name, label, result['ms'], '%s (%s)' % (result['trips'], result['logins']),
+                                                             result['objects'], result['rss'], summary(result['calls']))
+            finally:
+                if service is not None: stop_service(profile, service)
+                shutil.rmtree(profile)
+    finally:
+        box.stop()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--run':
+        run(sys.argv[2], sys.argv[3:])
+    else:
+        import argparse
+
+        parser = argparse.ArgumentParser(description='End-to-end scenarios of default.py against a fake FRITZ!Box')
+        parser.add_argument('--runs', type=int, default=5, help='runs per scenario, the first one is cold')
+        parser.add_argument('--devices', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+        parser.add_argument('--service', action='store_true', help='run the background service during the scenarios')
+        parser.add_argument('scenarios', nargs='*', help=', '.join(scenario[0] for scenario in SCENARIOS))
+        main(parser.parse_args())
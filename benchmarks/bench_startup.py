@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Startup cost of default.py per action: wall time of a complete script run in a new interpreter and
+the modules it imports, measured with the stub Kodi modules in benchmarks/stubs.
+
+    python benchmarks/bench_startup.py [runs]
+
+The actions run against the fake FRITZ!Box (benchmarks/fakebox.py), so the switch actions send their
+command as with a real box. The session and the snapshot the widget reads are prepared by a refresh
+of the device list, as the service would do. The runs are separated by the default debounce window,
+so a switch command isn't merged with the one of the previous run.
+'''
+
+import os
+import sys
+import json
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), ROOT]
+
+# modules which are expensive to import and not needed by every action
+
+HEAVY = ('requests', 'xml.dom.minidom', 'multiprocessing', 'resources.lib.slider', 'xml.etree.cElementTree', 'hashlib')
+
+ACTIONS = [
+    ('widget', ['plugin://script.program.fritzact/', '1', '?ts=']),
+    ('toggle', ['default.py', 'action=toggle&ain=08761%200000001']),
+    ('on', ['default.py', 'action=on&ain=08761%200000001']),
+    ('off', ['default.py', 'action=off&ain=08761%200000001']),
+    ('temp', ['default.py', 'action=temp&ain=09995%200000002']),
+    ('setreadonlyain', ['default.py', 'action=setreadonlyain']),
+    ('reset_session', ['default.py', 'action=reset_session']),
+]
+
+# default debounce window of the switch commands (ms)
+
+DEBOUNCE = 300
+
+
+def environment(profile, box):
+    env = dict(os.environ, FRITZACT_PROFILE=profile, FRITZACT_fbServer=box.address, FRITZACT_fbUsername='admin',
+               FRITZACT_fbPasswd='secret', FRITZACT_cacheTTL='3600', PYTHONPATH=os.pathsep.join(sys.path[0:2]),
+               PYTHONDONTWRITEBYTECODE='')
+    return env
+
+
+def prepare():
+
+    # log in and publish the snapshot of the device list, as the service would do
+
+    from resources.lib.fritzbox import FritzBox
+
+    fritz = FritzBox()
+    fritz.refresh()
+    for box in fritz.boxes: box.session.close()
+
+
+def run(argv):
+    sys.argv = argv
+    os.chdir(ROOT)
+    try:
+        execfile(os.path.join(ROOT, 'default.py'), {'__name__': '__main__'})
+    except SystemExit:
+        pass
+    print json.dumps(sorted(sys.modules))
+
+
+def main(runs):
+
+    # imported here, so the measured script runs (--run) don't load them
+
+    import shutil
+    import subprocess
+    import tempfile
+    from fakebox import FakeFritzBox
+
+    box = FakeFritzBox(count=20).start()
+    profile = tempfile.mkdtemp(prefix='fritzact-startup-')
+    try:
+        env = environment(profile, box)
+        subprocess.check_call([sys.executable, __file__, '--prepare'], env=env)
+
+        start = time.time()
+        for n in range(runs): subprocess.check_call([sys.executable, '-c', 'pass'], env=env)
+        interpreter = (time.time() - start) / runs * 1000
+
+        print 'interpreter start: %.1f ms' % interpreter
+        print '%-16s %10s %10s %9s  %s' % ('action', 'total [ms]', 'addon [ms]', 'modules', 'heavy modules loaded')
+        for name, argv in ACTIONS:
+            times = list()
+            for n in range(runs):
+                time.sleep(DEBOUNCE / 1000.0)
+                start = time.time()
+                output = subprocess.check_output([sys.executable, __file__, '--run'] + argv, env=env)
+                times.append((time.time() - start) * 1000)
+            modules = json.loads(output.strip().splitlines()[-1])
+            total = sorted(times)[len(times) // 2]
+            print '%-16s %10.1f %10.1f %9d  %s' % (name, total, total - interpreter, len(modules),
+                                                  ', '.join(module for module in HEAVY if module in modules))
+    finally:
+        shutil.rmtree(profile)
+        box.stop()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--prepare':
+        prepare()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(sys.argv[2:])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
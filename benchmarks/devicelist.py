@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# Synthetic devicelists as returned by getdevicelistinfos, a mix of FRITZ!DECT 200 (switch with
+# power meter), FRITZ!DECT 301 and Comet DECT (thermostats) and groups of switches
+
+DECT200 = '''<device identifier="08761 {n:07d}" id="{id}" functionbitmask="35712" fwversion="04.16" manufacturer="AVM" productname="FRITZ!DECT 200">
+<present>1</present><txbusy>0</txbusy><name>Steckdose {n}</name>
+<switch><state>{state}</state><mode>manuell</mode><lock>0</lock><devicelock>0</devicelock></switch>
+<simpleonoff><state>{state}</state></simpleonoff>
+<powermeter><voltage>230123</voltage><power>{power}</power><energy>{energy}</energy></powermeter>
+<temperature><celsius>{celsius}</celsius><offset>0</offset></temperature>
+</device>'''
+
+DECT301 = '''<device identifier="09995 {n:07d}" id="{id}" functionbitmask="320" fwversion="05.02" manufacturer="AVM" productname="FRITZ!DECT 301">
+<present>1</present><txbusy>0</txbusy><name>Heizung {n}</name><battery>{battery}</battery><batterylow>0</batterylow>
+<temperature><celsius>{celsius}</celsius><offset>0</offset></temperature>
+<hkr><tist>{tist}</tist><tsoll>{tsoll}</tsoll><absenk>32</absenk><komfort>42</komfort><lock>0</lock><devicelock>0</devicelock>
+<errorcode>0</errorcode><windowopenactiv>0</windowopenactiv><boostactive>0</boostactive><batterylow>0</batterylow>
+<battery>{battery}</battery><nextchange><endperiod>1538341200</endperiod><tchange>32</tchange></nextchange></hkr>
+</device>'''
+
+COMET = '''<device identifier="11960 {n:07d}" id="{id}" functionbitmask="320" fwversion="03.54" manufacturer="AVM" productname="Comet DECT">
+<present>1</present><name>Comet {n}</name>
+<temperature><celsius>{celsius}</celsius><offset>0</offset></temperature>
+<hkr><tist>{tist}</tist><tsoll>{tsoll}</tsoll><absenk>32</absenk><komfort>42</komfort><lock>0</lock><devicelock>0</devicelock>
+<errorcode>0</errorcode><batterylow>0</batterylow><nextchange><endperiod>1538341200</endperiod><tchange>32</tchange></nextchange></hkr>
+</device>'''
+
+GROUP = '''<group identifier="{a:02X}:{b:02X}:{c:02X}-{n:03d}" id="{id}" functionbitmask="6784" fwversion="1.0" manufacturer="AVM" productname="">
+<present>1</present><name>Gruppe {n}</name>
+<switch><state>{state}</state><mode>manuell</mode><lock>0</lock><devicelock>0</devicelock></switch>
+<powermeter><voltage>230123</voltage><power>{power}</power><energy>{energy}</energy></powermeter>
+<groupinfo><masterdeviceid>0</masterdeviceid><members>{members}</members></groupinfo>
+</group>'''
+
+TEMPLATES = (DECT200, DECT200, DECT301, COMET, GROUP)
+
+
+def devices(count, state=0):
+
+    # Returns the entries of a devicelist with count devices, every entry is a dictionary with the template, the
+    # AIN and the values of the template. state changes the switch states and measured values, so consecutive
+    # polls can be simulated.
+
+    entries = list()
+    for n in range(count):
+        template = TEMPLATES[n % len(TEMPLATES)]
+        values = dict(n=n, id=16 + n, a=n % 256, b=(n // 256) % 256, c=0x56,
+                      state=(n + state) % 2, power=(n * 1371 + state * 17) % 150000, energy=n * 1234 + state,
+                      celsius=180 + (n + state) % 60, tist=36 + n % 10, tsoll=32 + (n + state) % 20, battery=100 - n % 90,
+                      members=','.join(str(16 + m) for m in range(max(0, n - 4), n) if m % len(TEMPLATES) < 2) or '16')
+        ain = template[template.index('identifier="') + 12:template.index('" id=')].format(**values)
+        entries.append(dict(template=template, ain=ain, values=values))
+    return entries
+
+
+def render(entries):
+
+    # devicelist of the given entries as UTF-8 encoded string
+
+    return '<?xml version="1.0" encoding="utf-8"?>\n<devicelist version="1">\n%s\n</devicelist>\n' % \
+           '\n'.join(entry['template'].format(**entry['values']) for entry in entries)
+
+
+def devicelist(count, state=0):
+
+    # Returns a devicelist with count entries as UTF-8 encoded string
+
+    return render(devices(count, state))
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Stand-in for the HTTP interface of a FRITZ!Box, used by the benchmarks. It implements the session
+handling of /login_sid.lua (MD5 or PBKDF2 challenge, SID, BlockTime) and the commands of
+/webservices/homeautoswitch.lua for a synthetic device list (see devicelist.py). Every request is
+counted, so the benchmarks can report the round trips of a scenario.
+
+    python benchmarks/fakebox.py [--port 8080] [--devices 20] [--latency 0.02] [--pbkdf2]
+
+The fake box accepts the user 'admin' with the password 'secret'.
+'''
+
+import os
+import sys
+import hashlib
+import random
+import threading
+import time
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from devicelist import devices, render
+
+INVALID = '0000000000000000'
+
+USERNAME = 'admin'
+PASSWORD = 'secret'
+
+# iterations of the two PBKDF2 stages, as in the example of AVM (Technical Note Session ID, FRITZ!OS 7.24)
+
+PBKDF2_ITERATIONS = (10000, 2000)
+
+
+class FakeFritzBox(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    '''
+    Threaded HTTP server with the state of the fake box: the devices, the valid SIDs and the
+    counters of all requests. latency (seconds) is added to every response. With pbkdf2 (the
+    iterations of both stages) the box sends a PBKDF2 challenge to clients which ask for version 2
+    as FRITZ!OS 7.24 does, otherwise a MD5 challenge.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, count=20, latency=0.0, pbkdf2=None):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeFritzBoxHandler)
+        self.latency = latency
+        self.pbkdf2 = pbkdf2
+        self.salt1 = '%016x' % random.getrandbits(64)
+        self.devices = devices(count)
+        self.sids = set()
+        self.challenge = None
+        self.blocktime = 0
+        self.lock = threading.Lock()
+        self.requests = list()
+        self.thread = None
+
+    @property
+    def address(self):
+        return '%s:%s' % self.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, path=None, cmd=None):
+
+        # number of requests so far, optionally of a path or a switch command only
+
+        with self.lock:
+            return len([request for request in self.requests
+                        if (path is None or request[0] == path) and (cmd is None or request[1] == cmd)])
+
+    def reset(self):
+        with self.lock:
+            del self.requests[:]
+
+    def device(self, ain):
+        for entry in self.devices:
+            if entry['ain'] == ain: return entry
+        return None
+
+    def login(self, query):
+
+        # login_sid.lua: validate a SID, answer a challenge or return a new challenge
+
+        sid = query.get('sid')
+        if sid in self.sids: return sid, 0
+        if 'response' in query and self.challenge is not None:
+            if self.challenge.startswith('2$'):
+                iter1, salt1, iter2, salt2 = self.challenge.split('$')[1:]
+                hash1 = hashlib.pbkdf2_hmac('sha256', PASSWORD, salt1.decode('hex'), int(iter1))
+                expected = salt2 + '$' + hashlib.pbkdf2_hmac('sha256', hash1, salt2.decode('hex'), int(iter2)).encode('hex')
+            else:
+                expected = self.challenge + '-' + hashlib.md5((self.challenge + '-' + PASSWORD).encode('utf-16le')).hexdigest()
+            if query.get('username') == USERNAME and query['response'] == expected:
+                sid = '%016x' % random.getrandbits(64)
+                self.sids.add(sid)
+                self.challenge = None
+                self.blocktime = 0
+                return sid, 0
+            self.blocktime = max(1, self.blocktime * 2)
+        if self.pbkdf2 and query.get('version') == '2':
+            self.challenge = '2$%s$%s$%s$%016x' % (self.pbkdf2[0], self.salt1, self.pbkdf2[1], random.getrandbits(64))
+        else:
+            self.challenge = '%08x' % random.getrandbits(32)
+        return INVALID, self.blocktime
+
+    def command(self, query):
+
+        # homeautoswitch.lua: returns the HTTP status and the body of the response
+
+        cmd = query.get('switchcmd')
+        entry = self.device(query.get('ain'))
+        if cmd == 'getdevicelistinfos':
+            return 200, render(self.devices)
+        if cmd == 'getswitchlist':
+            return 200, ','.join(entry['ain'] for entry in self.devices if '{state}' in entry['template']) + '\n'
+        if entry is None:
+            return 400, ''
+        values = entry['values']
+        if cmd == 'getdeviceinfos':
+            return 200, entry['template'].format(**values)
+        if cmd in ('setswitchon', 'setswitchoff', 'setswitchtoggle'):
+            values['state'] = {'setswitchon': 1, 'setswitchoff': 0, 'setswitchtoggle': 1 - values['state']}[cmd]
+
+            # a group switches its members
+
+            if '{members}' in entry['template']:
+                for member in self.devices:
+                    if str(member['values']['id']) in values['members'].split(','): member['values']['state'] = values['state']
+            return 200, '%s\n' % values['state']
+        if cmd == 'getswitchstate':
+            return 200, '%s\n' % values['state']
+        if cmd == 'getswitchname':
+            return 200, '%s\n' % entry['template'][entry['template'].index('<name>') + 6:entry['template'].index('</name>')].format(**values)
+        if cmd == 'getswitchpresent':
+            return 200, '1\n'
+        if cmd == 'gettemperature':
+            return 200, '%s\n' % values['celsius']
+        if cmd == 'getswitchpower':
+            return 200, '%s\n' % values['power']
+        if cmd == 'getswitchenergy':
+            return 200, '%s\n' % values['energy']
+        if cmd == 'gethkrtsoll':
+            return 200, '%s\n' % values['tsoll']
+        if cmd == 'getbasicdevicestats':
+            if '{power}' not in entry['template']: return 200, '<devicestats></devicestats>'
+            return 200, '<devicestats><power><stats count="360" grid="10">%s</stats></power>' \
+                        '<energy><stats count="31" grid="86400">%s</stats></energy></devicestats>' % \
+                   (','.join(str(values['power'] // 10 + n % 7) for n in range(360)), ','.join(str(100 + n) for n in range(31)))
+        if cmd == 'sethkrtsoll':
+            values['tsoll'] = int(query.get('param', values['tsoll']))
+            return 200, '%s\n' % values['tsoll']
+        return 400, ''
+
+
+class FakeFritzBoxHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    # write the response buffered and without Nagle's algorithm, otherwise the delayed ACK of the client adds
+    # 40 ms to most responses
+
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        box = self.server
+
+        if box.latency > 0: time.sleep(box.latency)
+        with box.lock:
+            box.requests.append((url.path, query.get('switchcmd')))
+            if url.path == '/login_sid.lua':
+                sid, blocktime = box.login(query)
+                status, body = 200, '<?xml version="1.0" encoding="utf-8"?><SessionInfo><SID>%s</SID><Challenge>%s</Challenge>' \
+                                    '<BlockTime>%s</BlockTime><Rights></Rights></SessionInfo>' % (sid, box.challenge or '', blocktime)
+            elif url.path == '/webservices/homeautoswitch.lua':
+                if query.get('sid') not in box.sids: status, body = 403, ''
+                else: status, body = box.command(query)
+            else:
+                status, body = 404, ''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fake FRITZ!Box for the benchmarks')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--pbkdf2', action='store_true', help='PBKDF2 challenge (FRITZ!OS 7.24 and later)')
+    args = parser.parse_args()
+
+    box = FakeFritzBox(args.port, args.devices, args.latency, PBKDF2_ITERATIONS if args.pbkdf2 else None)
+    print 'Fake FRITZ!Box with %s devices on %s, user %s, password %s' % (args.devices, box.address, USERNAME, PASSWORD)
+    try:
+        box.serve_forever()
+    except KeyboardInterrupt:
+        pass
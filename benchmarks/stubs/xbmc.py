@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# Minimal stand-in for the Kodi module xbmc, used by the benchmarks only. The calls of the stub modules
+# are recorded in calls as (function, arguments), log messages are counted only.
+
+import os
+import time
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+
+PROFILE = os.environ.get('FRITZACT_PROFILE', '/tmp/fritzact-benchmark')
+
+# Kodi debug logging, enabled with KODI_DEBUG=true
+
+DEBUG = os.environ.get('KODI_DEBUG', 'false') == 'true'
+
+calls = list()
+logs = [0]
+
+
+def record(function, *args):
+    calls.append((function, args))
+
+
+def log(msg, level=LOGDEBUG):
+    logs[0] += 1
+
+
+def translatePath(path):
+    if path.startswith('special://profile/'):
+        return os.path.join(PROFILE, path[len('special://profile/'):])
+    return path
+
+
+def executebuiltin(function, wait=False):
+    record('xbmc.executebuiltin', function)
+
+
+def getCondVisibility(condition):
+    if condition == 'System.GetBool(debug.showloginfo)': return DEBUG
+    return False
+
+
+def sleep(milliseconds):
+    record('xbmc.sleep', milliseconds)
+    time.sleep(milliseconds / 1000.0)
+
+
+# Kodi asks the service to quit when the file abort exists in the profile
+
+ABORT = os.path.join(PROFILE, 'abort')
+
+
+class Monitor(object):
+
+    def abortRequested(self):
+        return os.path.exists(ABORT)
+
+    def waitForAbort(self, timeout=0):
+        end = time.time() + (timeout or 0)
+        while not self.abortRequested():
+            if timeout is not None and time.time() >= end: return False
+            time.sleep(0.05)
+        return True
+
+
+class Player(object):
+
+    def isPlayingVideo(self):
+        return False
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Minimal stand-in for the Kodi module xbmcaddon, used by the benchmarks only. Settings can be
+# provided as FRITZACT_<setting id> environment variables, e.g. FRITZACT_fbServer=127.0.0.1:8080.
+# Changed settings are stored in the profile (settings.json) and override the environment, as the
+# settings of a Kodi addon persist between script runs.
+
+import os
+import json
+
+import xbmc
+
+_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_stored = os.path.join(xbmc.PROFILE, 'settings.json')
+_strings = dict()
+
+_settings = {
+    'fbServer': 'fritz.box',
+    'fbTLS': 'false',
+    'unknownAIN': 'true',
+    'serviceEnabled': 'false',
+    'pollInterval': '60',
+    'cacheTTL': '0',
+    'debounce': '300',
+}
+_settings.update((key[9:], value) for key, value in os.environ.items() if key.startswith('FRITZACT_'))
+try:
+    with open(_stored) as handle:
+        _settings.update(json.load(handle))
+except (IOError, ValueError):
+    pass
+
+
+class Addon(object):
+
+    def __init__(self, id=None):
+        pass
+
+    def getAddonInfo(self, key):
+        return {'id': 'script.program.fritzact', 'name': 'Fritz Smart Home', 'version': 'benchmark',
+                'path': _root, 'profile': 'special://profile/addon_data/script.program.fritzact/'}.get(key, '')
+
+    def getSetting(self, key):
+        return _settings.get(key, '')
+
+    def setSetting(self, key, value):
+        xbmc.record('xbmcaddon.setSetting', key, value)
+        _settings[key] = value
+        try:
+            with open(_stored) as handle:
+                stored = json.load(handle)
+        except (IOError, ValueError):
+            stored = dict()
+        stored[key] = value
+        if not os.path.exists(xbmc.PROFILE): os.makedirs(xbmc.PROFILE)
+        with open(_stored, 'w') as handle:
+            json.dump(stored, handle)
+
+    def getLocalizedString(self, id):
+        if not _strings:
+            import io
+            import re
+
+            path = os.path.join(_root, 'resources', 'language', 'resource.language.en_gb', 'strings.po')
+            with io.open(path, encoding='utf-8') as handle:
+                _strings.update((int(key), value) for key, value in re.findall(r'msgctxt "#(\d+)"\s+msgid "(.*)"', handle.read()))
+        return _strings.get(id, u'#%s' % id)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Minimal stand-in for the Kodi module xbmcgui, used by the benchmarks only. The answers of the dialogs
+# are scripted in responses: 'select' and 'multiselect' are lists of return values, 'actions' is a list
+# of action ids sent to a modal window (e.g. the slider) after onInit.
+
+import os
+import json
+import threading
+
+import xbmc
+
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+
+_properties = dict()
+_lock = threading.RLock()
+
+responses = {'select': list(), 'multiselect': list(), 'actions': list()}
+
+
+def _response(dialog, default):
+    return responses[dialog].pop(0) if responses[dialog] else default
+
+
+class Window(object):
+
+    # The properties of the Home window (10000) are shared by all scripts in Kodi, the stub keeps them in the
+    # profile (window-10000.json), so a script sees the properties of the service and of previous runs
+
+    def __init__(self, windowId=-1):
+        self.windowId = windowId
+        self.properties = _properties.setdefault(windowId, dict())
+        self.path = os.path.join(xbmc.PROFILE, 'window-10000.json') if windowId == 10000 else None
+
+    def load(self):
+        if self.path is None: return
+        try:
+            with open(self.path) as handle:
+                self.properties.clear()
+                self.properties.update(json.load(handle))
+        except (IOError, ValueError):
+            pass
+
+    def store(self):
+        if self.path is None: return
+        if not os.path.exists(xbmc.PROFILE): os.makedirs(xbmc.PROFILE)
+        with open(self.path + '.%s' % os.getpid(), 'w') as handle:
+            json.dump(self.properties, handle)
+        os.rename(self.path + '.%s' % os.getpid(), self.path)
+
+    def getProperty(self, key):
+        with _lock:
+            self.load()
+            return self.properties.get(key, '')
+
+    def setProperty(self, key, value):
+        xbmc.record('xbmcgui.Window.setProperty', key, value)
+        with _lock:
+            self.load()
+            self.properties[key] = value
+            self.store()
+
+    def clearProperty(self, key):
+        xbmc.record('xbmcgui.Window.clearProperty', key)
+        with _lock:
+            self.load()
+            self.properties.pop(key, None)
+            self.store()
+
+
+class Action(object):
+
+    def __init__(self, id):
+        self.id = id
+
+    def getId(self):
+        return self.id
+
+    def __eq__(self, other):
+        return self.id == (other.id if isinstance(other, Action) else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class Control(object):
+
+    def __init__(self):
+        self.label = ''
+        self.percent = 0.0
+
+    def setLabel(self, label):
+        self.label = label
+
+    def getPercent(self):
+        return self.percent
+
+    def setPercent(self, percent):
+        self.percent = percent
+
+
+class WindowXMLDialog(Window):
+
+    def __init__(self, *args, **kwargs):
+        Window.__init__(self)
+
+    def getControl(self, controlId):
+        return self.__dict__.setdefault('_controls', dict()).setdefault(controlId, Control())
+
+    def onInit(self):
+        pass
+
+    def onAction(self, action):
+        pass
+
+    def doModal(self):
+        xbmc.record('xbmcgui.WindowXMLDialog.doModal', self.__class__.__name__)
+        self.onInit()
+        while responses['actions']:
+            self.onAction(Action(responses['actions'].pop(0)))
+
+    def close(self):
+        pass
+
+
+class ListItem(object):
+
+    def __init__(self, label='', label2=''):
+        self.label = label
+        self.label2 = label2
+        self.art = dict()
+        self.properties = dict()
+
+    def setArt(self, art):
+        self.art.update(art)
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+
+class Dialog(object):
+
+    def notification(self, heading, message, icon=None, time=5000, sound=True):
+        xbmc.record('xbmcgui.Dialog.notification', message, icon)
+
+    def select(self, heading, items, autoclose=0, preselect=-1, useDetails=False):
+        xbmc.record('xbmcgui.Dialog.select', len(items))
+        return _response('select', -1)
+
+    def multiselect(self, heading, options, autoclose=0, preselect=None, useDetails=False):
+        xbmc.record('xbmcgui.Dialog.multiselect', len(options))
+        return _response('multiselect', None)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+# Minimal stand-in for the Kodi module xbmcplugin, used by the benchmarks only
+
+import xbmc
+
+items = list()
+
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    xbmc.record('xbmcplugin.addDirectoryItem', handle, listitem.label)
+    items.append(listitem)
+    return True
+
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    xbmc.record('xbmcplugin.endOfDirectory', handle, len(items))
+
+
+def setProperty(handle, key, value):
+    xbmc.record('xbmcplugin.setProperty', handle, key, value)
@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+HTTP round trips per user action: default.py is run as Kodi starts it (a new interpreter per call, see
+bench_scenarios.py) against the fake FRITZ!Box, the requests the box has received are asserted. The
+first call of an action starts with an empty addon profile (cold), the second one keeps the SID and
+the snapshot (warm). A widget is never refreshed by the script itself (Container.Refresh), the skin
+reloads it when the timestamp of the snapshot changes.
+
+    python benchmarks/test_roundtrips.py [-v]
+'''
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[0:0] = [os.path.join(BENCHMARKS, 'stubs'), BENCHMARKS, os.path.dirname(BENCHMARKS)]
+
+from fakebox import FakeFritzBox
+from bench_scenarios import SCENARIOS, environment, timestamp
+
+LOGIN = '/login_sid.lua'
+
+
+class RoundTrips(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.box = FakeFritzBox(count=20).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.box.stop()
+
+    def setUp(self):
+        self.profile = tempfile.mkdtemp(prefix='fritzact-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.profile)
+
+    def call(self, name, count=1, **settings):
+
+        # runs the scenario name of bench_scenarios.py count times at once, returns the Kodi calls of the scripts
+
+        argv, responses = [(argv, responses) for scenario, argv, responses in SCENARIOS if scenario == name][0]
+        env = environment(self.profile, self.box)
+        env.update(('FRITZACT_%s' % key, value) for key, value in settings.items())
+        env['FRITZACT_RESPONSES'] = json.dumps(responses)
+
+        self.box.reset()
+        arguments = [argument.replace('{ts}', timestamp(self.profile)) for argument in argv]
+        scripts = [subprocess.Popen([sys.executable, os.path.join(BENCHMARKS, 'bench_scenarios.py'), '--run', name] + arguments,
+                                    env=env, stdout=subprocess.PIPE) for n in range(count)]
+        calls = list()
+        for script in scripts:
+            output = script.communicate()[0]
+            self.assertEqual(script.returncode, 0)
+            calls.extend(call[0] for call in json.loads(output.strip().splitlines()[-1])['calls'])
+        return calls
+
+    def assertTrips(self, trips, logins=0, commands=None):
+        self.assertEqual(self.box.count(), trips)
+        self.assertEqual(self.box.count(path=LOGIN), logins)
+        if commands is not None:
+            for cmd, count in commands.items(): self.assertEqual(self.box.count(cmd=cmd), count)
+
+    def test_toggle(self):
+
+        # cold: challenge and login, the device list (the device to switch is unknown), the command;
+        # warm: the command only, the result is applied to the snapshot. Default settings (debounce 300 ms).
+
+        calls = self.call('toggle')
+        self.assertTrips(4, logins=2, commands={'getdevicelistinfos': 1, 'setswitchtoggle': 1})
+        self.assertNotIn('xbmc.executebuiltin', calls)
+
+        calls = self.call('toggle')
+        self.assertTrips(1, commands={'setswitchtoggle': 1})
+        self.assertNotIn('xbmc.executebuiltin', calls)
+
+    def test_toggle_debounced(self):
+
+        # the first command of a device is sent without waiting for the debounce window, three toggles within the
+        # window are one toggle: the first one is sent, the other two cancel each other
+
+        calls = self.call('toggle', debounce='300')
+        self.assertTrips(4, logins=2, commands={'setswitchtoggle': 1})
+        self.assertNotIn('xbmc.sleep', calls)
+
+        self.call('toggle', count=3, debounce='2000')
+        self.assertTrips(1, commands={'setswitchtoggle': 1})
+
+    def test_temp(self):
+        self.call('temp')
+        self.assertTrips(6, logins=2, commands={'sethkrtsoll': 1})
+        self.call('temp')
+        self.assertTrips(2, commands={'sethkrtsoll': 1})
+
+    def test_widget(self):
+
+        # the reload of the widget after a change (same timestamp) is served from the snapshot
+
+        calls = self.call('widget')
+        self.assertTrips(3, logins=2, commands={'getdevicelistinfos': 1})
+        self.assertNotIn('xbmc.executebuiltin', calls)
+
+        self.call('widget-reload')
+        self.assertTrips(0)
+
+    def test_select(self):
+        self.call('select')
+        self.assertTrips(4, logins=2, commands={'getdevicelistinfos': 1, 'setswitchtoggle': 1})
+        self.call('select')
+        self.assertTrips(2, commands={'getdevicelistinfos': 1, 'setswitchtoggle': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
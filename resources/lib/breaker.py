@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from time import time
+
+from resources.lib.tools import *
+
+PROP_BREAKER = 'fritzact.breaker.%s'
+
+# consecutive connection failures which open the breaker, the backoff doubles with every failed probe
+
+FAILURE_THRESHOLD = 2
+BACKOFF = 30
+BACKOFF_MAX = 600
+
+# a probe which doesn't finish within this time (seconds) is given up, the next call probes again
+
+PROBE_TIMEOUT = 15
+
+
+class CircuitBreaker(object):
+
+    '''
+    Circuit breaker of the HTTP calls to a FritzBox. After FAILURE_THRESHOLD consecutive connection
+    failures (unreachable, timeout) the breaker opens and calls fail immediately instead of waiting
+    for the timeout of every request. When the backoff has expired, a single call is let through as
+    probe, it closes the breaker on success or opens it for the doubled backoff on failure.
+
+    The state is kept in a Window(10000) property (failures:open until), so all script runs and the
+    service share it.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.key = PROP_BREAKER % name
+        self.window = xbmcgui.Window(10000)
+
+    def load(self):
+        try:
+            failures, until = self.window.getProperty(self.key).split(':')
+            return int(failures), float(until)
+        except ValueError:
+            return 0, 0.0
+
+    def store(self, failures, until):
+        if failures == 0: self.window.clearProperty(self.key)
+        else: self.window.setProperty(self.key, '%s:%.3f' % (failures, until))
+
+    def isOpen(self):
+
+        # True if calls are refused or a probe is due, i.e. the FritzBox was unreachable recently
+
+        return self.load()[0] >= FAILURE_THRESHOLD
+
+    def isBlocked(self):
+
+        # True if calls are refused until the backoff has expired
+
+        failures, until = self.load()
+        return failures >= FAILURE_THRESHOLD and time() < until
+
+    def retryIn(self):
+
+        # seconds until the next probe
+
+        return max(0, int(self.load()[1] - time()))
+
+    def allow(self):
+
+        # True if a call may be made, the first call after the backoff is the probe
+
+        failures, until = self.load()
+        if failures < FAILURE_THRESHOLD: return True
+        if time() < until: return False
+        writeLog('Probe FritzBox %s after %s failures', self.name, failures)
+        self.store(failures, time() + PROBE_TIMEOUT)
+        return True
+
+    def success(self):
+        if self.load()[0] > 0:
+            writeLog('FritzBox %s reachable again', self.name, level=xbmc.LOGNOTICE)
+            self.store(0, 0)
+
+    def reset(self):
+        self.store(0, 0)
+
+    def failure(self):
+        failures = self.load()[0] + 1
+        until = 0
+        if failures >= FAILURE_THRESHOLD:
+            backoff = min(BACKOFF_MAX, BACKOFF * 2 ** (failures - FAILURE_THRESHOLD))
+            until = time() + backoff
+            writeLog('FritzBox %s unreachable (%s failures), retry in %s seconds', self.name, failures, backoff,
+                     level=xbmc.LOGWARNING)
+        self.store(failures, until)
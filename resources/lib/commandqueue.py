@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+from time import time
+
+from resources.lib.tools import *
+
+QUEUE_FILE = 'commands.json'
+LOCK_TIMEOUT = 5
+
+# net command of a pending command (rows) and a new command (columns), None cancels the pending command
+
+MERGE = {
+    None:              {'setswitchtoggle': 'setswitchtoggle', 'setswitchon': 'setswitchon', 'setswitchoff': 'setswitchoff'},
+    'setswitchtoggle': {'setswitchtoggle': None, 'setswitchon': 'setswitchon', 'setswitchoff': 'setswitchoff'},
+    'setswitchon':     {'setswitchtoggle': 'setswitchoff', 'setswitchon': 'setswitchon', 'setswitchoff': 'setswitchoff'},
+    'setswitchoff':    {'setswitchtoggle': 'setswitchon', 'setswitchon': 'setswitchon', 'setswitchoff': 'setswitchoff'},
+}
+
+
+class CommandQueue(object):
+
+    '''
+    Pending switch commands of all running script instances, stored in the addon profile and guarded
+    by a lock file. A command without a pending command of its AIN is sent at once and opens the
+    debounce window. Every instance within the window merges its command into the pending command
+    of the AIN and waits for the window. Only the instance which added the last command of an AIN
+    sends the net command afterwards, all others quit silently.
+    '''
+
+    def __init__(self, debounce):
+        self.debounce = debounce
+        self.path = os.path.join(addonFolder('profile'), QUEUE_FILE)
+        self.lockfile = self.path + '.lock'
+
+    def lock(self):
+
+        # Take the lock file, raises OSError if it can't be created (e.g. the profile isn't writable) or if it isn't
+        # released within LOCK_TIMEOUT
+
+        import errno
+
+        if not os.path.exists(os.path.dirname(self.path)):
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(self.path)): raise
+
+        _until = time() + LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(self.lockfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except OSError as e:
+                if e.errno != errno.EEXIST or time() > _until: raise
+            self.breakLock()
+            xbmc.sleep(10)
+
+    def breakLock(self):
+
+        # Remove the lock of a crashed instance. It's renamed first, so only one instance removes it, a lock which was
+        # taken in the meantime by another instance is put back.
+
+        try:
+            if time() - os.path.getmtime(self.lockfile) <= LOCK_TIMEOUT: return
+            _stale = tempName(self.lockfile)
+            os.rename(self.lockfile, _stale)
+            if time() - os.path.getmtime(_stale) <= LOCK_TIMEOUT and not os.path.exists(self.lockfile):
+                os.rename(_stale, self.lockfile)
+            else:
+                os.remove(_stale)
+        except OSError:
+            pass
+
+    def unlock(self):
+        os.remove(self.lockfile)
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as handle:
+                return json.load(handle)
+        except (IOError, ValueError):
+            return dict()
+
+    def write(self, queue):
+        with open(self.path, 'w') as handle:
+            json.dump(queue, handle)
+
+    def push(self, ain, cmd):
+
+        # Merge cmd into the pending command of ain, returns the sequence number of this command. Sequence number 1 is
+        # the first command of a window, it isn't queued but sent at once (the pending command is None).
+
+        self.lock()
+        try:
+            queue = self.read()
+            pending = queue.get(ain)
+
+            # the window of a sent command is closed after the debounce time, ignore leftovers of instances which
+            # didn't finish
+
+            if pending is not None and time() - pending['ts'] > self.debounce / 1000.0 + (0 if pending['seq'] == 1 else LOCK_TIMEOUT):
+                pending = None
+
+            seq = 1 if pending is None else pending['seq'] + 1
+            net = None if pending is None else MERGE[pending['cmd']][cmd]
+
+            queue[ain] = {'cmd': net, 'seq': seq, 'ts': time()}
+            self.write(queue)
+            writeLog('Queued %s on device %s, net command: %s', cmd, ain, cmd if seq == 1 else net)
+            return seq
+        finally:
+            self.unlock()
+
+    def pop(self, ain, seq):
+
+        # Returns the net command of ain if seq is the last queued command, otherwise None
+
+        self.lock()
+        try:
+            queue = self.read()
+            pending = queue.get(ain)
+            if pending is None or pending['seq'] != seq: return None
+            del queue[ain]
+            self.write(queue)
+            return pending['cmd']
+        finally:
+            self.unlock()
+
+    def coalesce(self, ain, cmd):
+
+        # Queue cmd, wait for the debounce window and return the net command to send (None if there is nothing
+        # to send or another instance takes over). The first command of a window is returned without waiting.
+
+        try:
+            seq = self.push(ain, cmd)
+            if seq == 1: return cmd
+            xbmc.sleep(self.debounce)
+            return self.pop(ain, seq)
+        except (IOError, OSError) as e:
+
+            # without the queue the command is sent as it is
+
+            writeLog('Command queue not available, send %s unmerged: %s', cmd, str(e), level=xbmc.LOGWARNING)
+            return cmd
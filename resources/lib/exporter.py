@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import BaseHTTPServer
+import SocketServer
+
+from resources.lib.tools import *
+from resources.lib.snapshot import Snapshot
+from resources.lib.fritzbox import Registry
+
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_TYPE = 'application/json'
+
+
+def _degree(binary):
+
+    # target temperature of a thermostat (0.5 °C steps from 8 °C, 253 off and 254 on aren't temperatures)
+
+    return None if binary is None or not 16 <= binary <= 56 else (binary - 16) / 2.0 + 8
+
+
+# metrics of the devices: name, type, help and the function which returns the value of a Device (None if the device
+# doesn't provide it), the value of fritzact_stale is the reachability of the FritzBox
+
+METRICS = (
+    ('fritzact_present', 'gauge', 'Device is connected to the FritzBox', lambda device: device.present),
+    ('fritzact_stale', 'gauge', 'FritzBox of the device is unreachable, the values are the last known ones', None),
+    ('fritzact_switch_state', 'gauge', 'Switch is on', lambda device: device.switch_state),
+    ('fritzact_power_watts', 'gauge', 'Current power', lambda device: None if device.power_mw is None else device.power_mw / 1000.0),
+    ('fritzact_energy_watthours_total', 'counter', 'Energy since the device was set up', lambda device: device.energy_wh),
+    ('fritzact_temperature_celsius', 'gauge', 'Temperature of the device, including the offset',
+     lambda device: None if device.celsius is None else device.celsius / 10.0),
+    ('fritzact_target_temperature_celsius', 'gauge', 'Target temperature of the thermostat', lambda device: _degree(device.tsoll)),
+    ('fritzact_comfort_temperature_celsius', 'gauge', 'Comfort temperature of the thermostat', lambda device: _degree(device.komfort)),
+    ('fritzact_lowering_temperature_celsius', 'gauge', 'Lowering temperature of the thermostat', lambda device: _degree(device.absenk)),
+    ('fritzact_battery_percent', 'gauge', 'Battery charge', lambda device: device.battery_level),
+    ('fritzact_battery_low', 'gauge', 'Battery is low', lambda device: device.batterylow if device.battery_level is not None else None),
+)
+
+
+def _label(value):
+    return (value or '').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path in ('/metrics', '/'): body, content = self.server.render(self.server.asPrometheus), PROMETHEUS_TYPE
+        elif path in ('/metrics.json', '/json'): body, content = self.server.render(self.server.asJSON), JSON_TYPE
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    '''
+    HTTP endpoint of the service for external scrapers (e.g. Prometheus), so they don't query the
+    FritzBox a second time. /metrics returns the devices of the snapshot in the Prometheus text
+    format, /metrics.json as JSON. A scrape never sends a request to the FritzBox: the snapshot is
+    read again only if the service (or a script) has written it, the rendered responses are reused
+    as long as the snapshot, the time of the last query and the reachability of the boxes are the same.
+
+    The time the device list was changed and queried last are part of both formats, the age of the
+    values is the time of the scrape minus fritzact_snapshot_checked_timestamp_seconds.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, getFritz, port, external=False):
+
+        # getFritz returns the FritzBox of the service (only used for the state of the circuit breakers)
+
+        BaseHTTPServer.HTTPServer.__init__(self, ('' if external else '127.0.0.1', port), MetricsHandler)
+        self.getFritz = getFritz
+        self.port = port
+        self.external = external
+        self.snapshot = Snapshot()
+        self.lock = threading.Lock()
+        self.__cache = (None, None, None, dict())
+
+    def start(self):
+        _thread = threading.Thread(target=self.serve_forever)
+        _thread.daemon = True
+        _thread.start()
+        writeLog('Metrics server listening on port %s%s', self.port, ' (all interfaces)' if self.external else '')
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        writeLog('Metrics server stopped')
+
+    def render(self, output):
+
+        # the response of output (asPrometheus or asJSON) for the current snapshot, rendered once per change
+
+        with self.lock:
+            data = self.snapshot.read(reload=self.snapshot.isChanged())
+            registry = self.snapshot.index(Registry)
+            actors = list() if registry is None else registry.actors
+            stale = frozenset(self.getFritz().getStale(actors))
+            checked = self.snapshot.checked()
+
+            if self.__cache[0] is not data or self.__cache[1:3] != (checked, stale): self.__cache = (data, checked, stale, dict())
+            if output.__name__ not in self.__cache[3]: self.__cache[3][output.__name__] = output(data, actors, stale)
+            return self.__cache[3][output.__name__]
+
+    def asPrometheus(self, data, actors, stale):
+        lines = list()
+        if data is not None:
+            for name, description, value in (('fritzact_snapshot_changed_timestamp_seconds', 'Time the device state has changed last', data['timestamp']),
+                                             ('fritzact_snapshot_checked_timestamp_seconds', 'Time the device list was queried last', self.snapshot.checked()),
+                                             ('fritzact_snapshot_valid', 'Snapshot is not invalidated by a command or a change of the settings',
+                                              int(data.get('valid', True)))):
+                lines.extend(['# HELP %s %s' % (name, description), '# TYPE %s gauge' % name, '%s %s' % (name, value)])
+
+        for name, kind, description, value in METRICS:
+            samples = list()
+            for actor in actors:
+                _value = (1 if actor.actor_id in stale else 0) if value is None else value(actor)
+                if _value is None: continue
+                samples.append('%s{ain="%s",name="%s",type="%s"} %s' % (name, _label(actor.actor_id), _label(actor.name), actor.type, _value))
+            if samples: lines.extend(['# HELP %s %s' % (name, description), '# TYPE %s %s' % (name, kind)] + samples)
+        return '\n'.join(lines).encode('utf-8') + '\n'
+
+    def asJSON(self, data, actors, stale):
+        devices = list()
+        for actor in actors:
+            device = {'ain': actor.actor_id, 'name': actor.name, 'type': actor.type, 'stale': actor.actor_id in stale}
+            for name, kind, description, value in METRICS:
+                if value is not None: device[name[len('fritzact_'):]] = value(actor)
+            devices.append(device)
+        return json.dumps({'timestamp': None if data is None else data['timestamp'], 'checked': self.snapshot.checked(),
+                           'valid': data is not None and data.get('valid', True), 'devices': devices})
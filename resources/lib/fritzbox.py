@@ -0,0 +1,1222 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+'''
+Documentation for the login procedure
+https://avm.de/fileadmin/user_upload/Global/Service/Schnittstellen/AVM_Technical_Note_-_Session_ID.pdf
+
+Smart Home interface:
+https://avm.de/fileadmin/user_upload/Global/Service/Schnittstellen/AHA-HTTP-Interface.pdf
+'''
+
+from resources.lib.tools import *
+from resources.lib.snapshot import Snapshot
+from resources.lib.trace import span
+from resources.lib.breaker import CircuitBreaker
+from resources.lib.state import state
+
+import threading
+from time import time
+import re
+
+# Modules which are only needed by some actions (requests, hashlib, ElementTree, minidom and the slider window)
+# are imported where they are used, this keeps the startup of the script short.
+
+# icons of the device states (resources/lib/media)
+
+s_on = 'dect_on.png'
+s_off = 'dect_off.png'
+s_absent = 'dect_absent.png'
+t_on = 'comet_on.png'
+t_absent = 'comet_absent.png'
+t_lowbatt = 'comet_lowbatt.png'
+gs_on = 'dect_group_on.png'
+gs_off = 'dect_group_off.png'
+gt_on = 'comet_group_on.png'
+gt_absent = 'comet_group_absent.png'
+unknown_device = 'unknown.png'
+
+# max. number of concurrent requests to the FritzBox if several devices are switched at once
+
+MAX_WORKERS = 4
+
+# a session on the FritzBox expires after this idle time (seconds), the SID is renewed shortly before
+
+SID_LIFETIME = 600
+SID_RENEW = 60
+
+# max. number of FritzBoxes (box profiles of the settings)
+
+MAX_BOXES = 3
+
+
+def etree():
+
+    # ElementTree module, the C implementation if available
+
+    try:
+        from xml.etree import cElementTree as ET
+    except ImportError:
+        from xml.etree import ElementTree as ET
+    return ET
+
+
+def concurrently(function, items, workers=MAX_WORKERS):
+
+    # Returns [function(item) for item in items], computed by up to workers threads. The ThreadPool of
+    # multiprocessing isn't used, its join waits up to 100 ms for its housekeeping threads.
+
+    items = list(items)
+    results = [None] * len(items)
+    pending = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def _worker():
+        while True:
+            with lock:
+                n = next(pending, None)
+            if n is None: return
+            results[n] = function(items[n])
+
+    threads = [threading.Thread(target=_worker) for n in range(min(workers, len(items)))]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return results
+
+
+def prettify(xml):
+    from xml.dom import minidom
+
+    try:
+        reparse = minidom.parseString(xml)
+        return reparse.toprettyxml(indent='    ')
+    except AttributeError as e:
+        writeLog(e.message, level=xbmc.LOGERROR)
+        return False
+
+
+# Elements of the devices and groups of a raw devicelist and their AIN, devices and groups aren't nested
+
+DEVICE_ELEMENT = re.compile(r'<(device|group)\s.*?</\1>', re.S)
+IDENTIFIER = re.compile(r'identifier="([^"]*)"')
+
+
+def splitdevices(raw):
+
+    # Yields the AIN and the raw element of every device or group of a devicelist (the undecoded response), the
+    # elements are hashed and parsed one by one
+
+    for match in DEVICE_ELEMENT.finditer(raw):
+        element = match.group(0)
+        identifier = IDENTIFIER.search(element, 0, element.find('>'))
+        yield None if identifier is None else identifier.group(1), element
+
+
+# AIN of a group, e.g. 12:34:56:78-900
+
+GROUP_AIN = re.compile('([A-F]|[0-9]){2}:([A-F]|[0-9]){2}:([A-F]|[0-9]){2}-([A-F]|[0-9]){3}')
+
+
+class display(object):
+
+    # Display value of a Device, computed by the decorated method on first access and memoized
+
+    def __init__(self, method):
+        self.method = method
+        self.name = method.__name__
+
+    def __get__(self, device, owner):
+        if device is None: return self
+        if device._display is None: device._display = dict()
+        try:
+            return device._display[self.name]
+        except KeyError:
+            value = device._display[self.name] = self.method(device)
+            return value
+
+
+class Device(object):
+
+    # Function bits of the functionbitmask
+
+    isHanFun     = 0b00000000000001
+    isAlert      = 0b00000000010000
+    isThermostat = 0b00000001000000
+    isPowerMeter = 0b00000010000000
+    isTempSensor = 0b00000100000000
+    isPwrSwitch  = 0b00001000000000
+    isRepeater   = 0b00010000000001
+    isMicrophone = 0b00100000000000
+    isHanFunUnit = 0b10000000000000
+
+    # raw values as provided by the devicelist (power in mW, energy in Wh, celsius in 0.1 °C, tsoll, komfort and
+    # absenk in 0.5 °C), None if the device doesn't provide the value
+
+    FIELDS = ('actor_id', 'device_id', 'fwversion', 'productname', 'manufacturer', 'functionbitmask', 'is_group',
+              'name', 'present', 'switch_state', 'switch_mode', 'switch_lock', 'power_mw', 'energy_wh', 'celsius',
+              'tsoll', 'komfort', 'absenk', 'battery_level', 'batterylow', 'members')
+
+    __slots__ = FIELDS + ('_display',)
+
+    def __init__(self, device):
+
+        """
+        Funktionsbitmasken
+
+        Bit 0: HANFUN Gerät
+        Bit 4: Alarm-Sensor
+        Bit 6: Heizkörperregler
+        Bit 7: Energie Messgerät
+        Bit 8: Temperatursensor
+        Bit 9: Schaltsteckdose
+        Bit 10: AVM DECT Repeater
+        Bit 11: Mikrofon
+        Bit 13: HANFUN Unit
+        """
+
+        # Device attributes
+
+        self.actor_id = device.attrib['identifier']
+        self.device_id = device.attrib['id']
+        self.fwversion = device.attrib['fwversion']
+        self.productname = device.attrib['productname']
+        self.manufacturer = device.attrib['manufacturer']
+        self.functionbitmask = int(device.attrib['functionbitmask'])
+        self.is_group = device.tag == 'group' or GROUP_AIN.match(self.actor_id) is not None
+
+        self.name = None
+        self.present = 0
+        self.switch_state = self.switch_mode = self.switch_lock = None
+        self.power_mw = self.energy_wh = self.celsius = None
+        self.tsoll = self.komfort = self.absenk = None
+        self.battery_level = None
+        self.batterylow = 0
+        self.members = None
+        self._display = None
+
+        # visit every element only once, values of the function blocks are collected as tag/text pairs
+
+        switch = hkr = powermeter = temperature = groupinfo = None
+        for element in device:
+            if element.tag == 'name': self.name = element.text
+            elif element.tag == 'present': self.present = int(element.text or '0')
+            elif element.tag == 'battery': self.battery_level = int(element.text)
+            elif element.tag == 'batterylow': self.batterylow = int(element.text)
+            elif element.tag == 'switch': switch = dict((e.tag, e.text) for e in element)
+            elif element.tag == 'hkr': hkr = dict((e.tag, e.text) for e in element)
+            elif element.tag == 'powermeter': powermeter = dict((e.tag, e.text) for e in element)
+            elif element.tag == 'temperature': temperature = dict((e.tag, e.text) for e in element)
+            elif element.tag == 'groupinfo': groupinfo = dict((e.tag, e.text) for e in element)
+
+        # Switch attributes
+
+        if self.is_switch and switch is not None:
+            self.switch_state = int(switch.get('state') or '0')
+            self.switch_mode = switch.get('mode')
+            self.switch_lock = int(switch.get('lock') or '0')
+
+        # Thermostat attributes
+
+        if self.is_thermostat and hkr is not None:
+            self.tsoll = int(hkr.get('tsoll') or '0')
+            self.komfort = int(hkr.get('komfort') or '0')
+            self.absenk = int(hkr.get('absenk') or '0')
+
+        # Power attributes
+
+        if self.has_powermeter and powermeter is not None:
+            if powermeter.get('power') is not None: self.power_mw = int(powermeter['power'])
+            if powermeter.get('energy') is not None: self.energy_wh = int(powermeter['energy'])
+
+        # Temperature attributes
+
+        if self.has_temperature and temperature is not None and temperature.get('celsius') is not None:
+            self.celsius = int(temperature['celsius'])
+
+        # Group attributes, the device IDs (not the AINs) of the members
+
+        if self.is_group and groupinfo is not None and groupinfo.get('members'):
+            self.members = [member.strip() for member in groupinfo['members'].split(',') if member.strip()]
+
+    @classmethod
+    def bin2degree(cls, binary_value=0):
+        if 16 <= binary_value <= 56: return '{:0.1f}'.format((binary_value - 16)/2.0 + 8) + ' °C'.decode('utf-8')
+        elif binary_value == 253: return ['off']
+        elif binary_value == 254: return ['on']
+        return ['invalid']
+
+    @property
+    def is_thermostat(self):
+        return bool(self.functionbitmask & self.isThermostat)       # Comet DECT (Radiator Thermostat)
+
+    @property
+    def has_powermeter(self):
+        return bool(self.functionbitmask & self.isPowerMeter)       # Energy Sensor
+
+    @property
+    def has_temperature(self):
+        return bool(self.functionbitmask & self.isTempSensor)       # Temperature Sensor
+
+    @property
+    def is_switch(self):
+        return bool(self.functionbitmask & self.isPwrSwitch)        # Power Switch
+
+    @property
+    def is_repeater(self):
+        return bool(self.functionbitmask & self.isRepeater)         # DECT Repeater
+
+    @property
+    def unknown(self):
+        return not (self.is_switch or self.is_thermostat)
+
+    @property
+    def bin_slider(self):
+        return self.tsoll or 0
+
+    @property
+    def state(self):
+        return 'n/a' if self.switch_state is None else self.switch_state
+
+    @property
+    def mode(self):
+        return self.switch_mode or 'n/a'
+
+    @property
+    def lock(self):
+        return 'n/a' if self.switch_lock is None else self.switch_lock
+
+    def __repr__(self):
+
+        # compact representation with the raw values of the device, e.g. for the debug log
+
+        return 'Device(%s)' % ', '.join('%s=%r' % (field, getattr(self, field)) for field in self.FIELDS
+                                        if getattr(self, field) is not None)
+
+    def update(self, **values):
+
+        # Change raw values, memoized display values are computed again on next access
+
+        for field, value in values.items(): setattr(self, field, value)
+        self._display = None
+
+    @property
+    def type(self):
+        if self.is_repeater: return 'switch'
+        if self.is_group: return 'group'
+        if self.is_thermostat: return 'thermostat'
+        if self.is_switch: return 'switch'
+        return 'n/a'
+
+    @display
+    def power(self):
+        return 'n/a' if self.power_mw is None else '{:0.2f}'.format(self.power_mw / 1000.0) + ' W'
+
+    @display
+    def energy(self):
+        return 'n/a' if self.energy_wh is None else '{:0.2f}'.format(self.energy_wh / 1000.0) + ' kWh'
+
+    @display
+    def temperature(self):
+        return 'n/a' if self.celsius is None else '{:0.1f}'.format(self.celsius / 10.0) + ' °C'.decode('utf-8')
+
+    @display
+    def set_temp(self):
+        return 'n/a' if self.tsoll is None else self.bin2degree(self.tsoll)
+
+    @display
+    def comf_temp(self):
+        return 'n/a' if self.komfort is None else self.bin2degree(self.komfort)
+
+    @display
+    def lowering_temp(self):
+        return 'n/a' if self.absenk is None else self.bin2degree(self.absenk)
+
+    @display
+    def battery(self):
+        return 'n/a' if self.battery_level is None else '%s%%' % self.battery_level
+
+    @display
+    def icon(self):
+        if self.is_switch:
+            if self.present != 1: image = s_absent
+            elif self.switch_state == 0: image = gs_off if self.type == 'group' else s_off
+            else: image = gs_on if self.type == 'group' else s_on
+        elif self.is_thermostat:
+            if self.present != 1: image = t_absent
+            elif self.type == 'group': image = gt_on
+            else: image = t_lowbatt if self.batterylow == 1 else t_on
+        else:
+            image = unknown_device
+        return addonImage(image)
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    @classmethod
+    def from_dict(cls, attributes):
+
+        # Rebuild a device from a published snapshot without parsing XML
+
+        device = cls.__new__(cls)
+        for field in cls.FIELDS: setattr(device, field, attributes[field])
+        device._display = None
+        return device
+
+
+class Registry(object):
+
+    '''
+    Devices of a snapshot indexed by AIN and by type (groups are the type 'group'). The registry is built
+    once per read of the snapshot (see Snapshot.index), lookups of a single device don't scan the list.
+
+    The members of a group are given by their device IDs, which are unique per FritzBox only. They are
+    resolved to the devices of the box of the group, byGroup and byMember link groups and members by AIN.
+    '''
+
+    def __init__(self, devices):
+        self.actors = [Device.from_dict(device) for device in devices]
+        self.byAIN = dict()
+        self.byType = dict()
+        self.byGroup = dict()
+        self.byMember = dict()
+        _byID = dict()
+        for actor in self.actors:
+            self.byAIN[actor.actor_id] = actor
+            self.byType.setdefault(actor.type, list()).append(actor)
+            _byID[(actor.actor_id.partition('@')[2], actor.device_id)] = actor
+
+        for group in self.byType.get('group', list()):
+            _box = group.actor_id.partition('@')[2]
+            _members = [_byID[(_box, member)] for member in group.members or list() if (_box, member) in _byID]
+            self.byGroup[group.actor_id] = _members
+            for member in _members: self.byMember[member.actor_id] = group
+
+    def __len__(self):
+        return len(self.actors)
+
+    def __contains__(self, ain):
+        return ain in self.byAIN
+
+    def get(self, ain):
+        return self.byAIN.get(ain)
+
+    def select(self, devtype=None):
+        return list(self.actors) if devtype is None else list(self.byType.get(devtype, list()))
+
+    @property
+    def groups(self):
+        return self.byType.get('group', list())
+
+    def members(self, ain):
+
+        # the devices of a group, an empty list for devices and groups without known members
+
+        return list(self.byGroup.get(ain, list()))
+
+    def groupOf(self, ain):
+
+        # the group of a device, None if it isn't a member of a group
+
+        return self.byMember.get(ain)
+
+
+# single device commands of the Smart Home interface for the raw values of a Device
+
+QUERIES = {'name': 'getswitchname', 'present': 'getswitchpresent', 'switch_state': 'getswitchstate',
+           'celsius': 'gettemperature', 'tsoll': 'gethkrtsoll', 'power_mw': 'getswitchpower', 'energy_wh': 'getswitchenergy'}
+
+
+class Box(object):
+
+    '''
+    Connection to one FritzBox of the settings (box profile) with its own address, credentials, TLS flag and
+    session ID. Box 1 uses the settings fbServer, fbUsername, fbPasswd and fbTLS and the runtime data SID
+    and SIDts (see resources/lib/state.py), box n > 1 the same keys with the suffix n (fbServer2 ...). The AINs of the devices of box n > 1 are qualified
+    with the number of the box, e.g. 08761 0000001@2, the AINs of box 1 are kept as they are.
+    '''
+
+    INVALID = '0000000000000000'
+    login_url = '/login_sid.lua'
+
+    def __init__(self, number=1):
+        self.number = number
+        self.suffix = '' if number == 1 else str(number)
+        self.rights = None
+        self.loginLock = threading.Lock()
+        self.breaker = CircuitBreaker(number)
+        self.getSettings()
+        self.base_url = '%s%s' % (self.__fbtls, self.__fbserver)
+
+        # a SID which was validated or used recently is trusted without asking the FritzBox
+
+        self.established = self.isSIDTrusted()
+
+        self.__session = None
+
+    def setting(self, setting):
+        return '%s%s' % (setting, self.suffix)
+
+    def getSettings(self):
+        self.__fbserver = addon.getSetting(self.setting('fbServer'))
+        self.__fbuser = addon.getSetting(self.setting('fbUsername'))
+
+        # the password is only decrypted for a login, a newly entered password is sealed immediately
+
+        self.__fbpasswd = None
+        if addon.getSetting(self.setting('fbPasswd')) not in ('', '*'): self.getPassword()
+        self.__fbtls = 'https://' if addon.getSetting(self.setting('fbTLS')).upper() == 'TRUE' else 'http://'
+        self.__fbSID = state.get(self.setting('SID')) or None
+        self.__fbSIDts = float(state.get(self.setting('SIDts')) or '0')
+
+        # settings which have an effect on the device list, a snapshot made with other settings is invalid
+
+        self.signature = '|'.join([self.__fbtls, self.__fbserver, self.__fbuser])
+
+    @property
+    def sid(self):
+        return self.__fbSID
+
+    def getPassword(self):
+        if self.__fbpasswd is None:
+            with span('crypter'):
+                self.__fbpasswd = crypter(self.setting('fbPasswd'), self.setting('fb_key'), self.setting('fb_token'))
+        return self.__fbpasswd
+
+    @property
+    def session(self):
+
+        # the HTTP session is created with the first request
+
+        if self.__session is None:
+            import requests
+
+            self.__session = requests.Session()
+        return self.__session
+
+    def qualify(self, ain):
+        return ain if self.number == 1 else '%s@%s' % (ain, self.number)
+
+    def owns(self, ain):
+
+        # True if ain (qualified) is a device of this box
+
+        return ain.rpartition('@')[2] == self.suffix if '@' in ain else self.number == 1
+
+    def connect(self):
+
+        # True if a session is established, log in if necessary
+
+        if self.established or self.login(): return True
+        writeLog('Not logged in or no connection to FritzBox %s', self.__fbserver, level=xbmc.LOGERROR)
+        return False
+
+    def login(self):
+
+        # Validate the stored SID or request a new one, returns True if a session is established
+
+        import requests
+
+        if not self.breaker.allow():
+            writeLog('FritzBox %s unreachable, next try in %s seconds', self.__fbserver, self.breaker.retryIn())
+            return False
+
+        url = '%s%s' % (self.base_url, self.login_url)
+        blocktime = 0
+        try:
+            with span('sid-check'):
+                sid, challenge = self.getFbSID(url, self.__fbSID)
+            self.breaker.success()
+            if sid == self.INVALID:
+                writeLog('SID invalid or session expired, make challenge')
+                with span('challenge'):
+                    sid, blocktime = self.makeChallenge(url, challenge, self.__fbuser, self.getPassword())
+                if sid == self.INVALID and blocktime > 0:
+                    raise FritzBox.FbInvalidChallengeException()
+                else:
+                    writeLog('new SID: %s', sid)
+                    self.established = True
+            elif sid == self.__fbSID:
+                writeLog('Validation Ok')
+                self.established = True
+            if sid != self.__fbSID:
+                self.__fbSID = sid
+                state.set(self.setting('SID'), self.__fbSID)
+            if self.established: self.touchSID(force=True)
+            return self.established
+
+        except UnicodeDecodeError:
+            writeLog('UnicodeDecodeError, special chars not allowed in password challenge', level=xbmc.LOGERROR)
+            notifyOSD(addonName, LS(30016), icon=xbmcgui.NOTIFICATION_ERROR)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TypeError), e:
+            if not isinstance(e, TypeError): self.breaker.failure()
+            writeLog('FritzBox %s unreachable', self.__fbserver, level=xbmc.LOGERROR)
+            notifyOSD(addonName, LS(30010))
+        except FritzBox.FbInvalidChallengeException:
+            writeLog("Login blocked for %s seconds", blocktime, level=xbmc.LOGERROR)
+            notifyOSD(addonName, LS(30012) % blocktime)
+        except FritzBox.FbBadRequestException:
+            notifyOSD(addonName, LS(30011), xbmcgui.NOTIFICATION_ERROR, time=3000)
+        except (etree().ParseError, ValueError, AttributeError), e:
+
+            # the answer isn't a login page of a FritzBox, e.g. of a captive portal or a proxy
+
+            self.breaker.failure()
+            writeLog('Invalid answer of FritzBox %s: %s', self.__fbserver, str(e), level=xbmc.LOGERROR)
+            notifyOSD(addonName, LS(30011), xbmcgui.NOTIFICATION_ERROR, time=3000)
+        return False
+
+    def resetFbSession(self):
+        writeLog('Reset Session ID of FritzBox %s', self.__fbserver)
+        state.update({self.setting('SID'): self.INVALID, self.setting('SIDts'): '0'})
+
+    def isSIDTrusted(self):
+        return self.__fbSID not in (None, self.INVALID) and time() - self.__fbSIDts < SID_LIFETIME - SID_RENEW
+
+    def touchSID(self, force=False):
+
+        # Remember when the SID was validated or used last, the setting is written at most once a minute
+
+        if force or time() - self.__fbSIDts > 60:
+            self.__fbSIDts = time()
+            state.set(self.setting('SIDts'), str(int(self.__fbSIDts)))
+
+    def keepalive(self):
+
+        # Renew the session before it expires, validating the SID resets the idle timer of the FritzBox
+
+        if self.isSIDTrusted(): return True
+        writeLog('Session expires soon, renew SID')
+        self.established = False
+        return self.login()
+
+    def getFbSID(self, url, sid=None, timeout=5):
+        writeLog('Connecting to %s', url)
+        # version 2 asks for a PBKDF2 challenge, older FRITZ!OS versions ignore it and send a MD5 challenge
+
+        if sid is None or sid == self.INVALID:
+            response = self.session.get(url, params={'version': 2}, timeout=timeout, verify=False)
+        else:
+            writeLog('Validate SID %s', sid)
+            response = self.session.get(url, params={'version': 2, 'sid': sid}, timeout=timeout, verify=False)
+
+        if response.status_code != 200:
+            writeLog('Bad request or server error: %s', response.status_code)
+            raise FritzBox.FbBadRequestException()
+        xml = etree().fromstring(response.text)
+        return xml.find('SID').text, xml.find('Challenge').text
+
+    def makeChallenge(self, url, challenge, fbuser, fbpasswd, timeout=5):
+
+        # answer a PBKDF2 challenge (2$iter1$salt1$iter2$salt2, FRITZ!OS 7.24 and later) or a MD5 challenge
+
+        if challenge.startswith('2$'):
+            login_response = self.pbkdf2Response(challenge, fbpasswd)
+        else:
+            import hashlib
+
+            login_challenge = (challenge + '-' + fbpasswd).encode('utf-16le')
+            login_response = challenge + '-' + hashlib.md5(login_challenge).hexdigest()
+        response = self.session.get(url, params={'username': fbuser, 'response': login_response}, timeout=timeout)
+
+        if response.status_code != 200:
+            writeLog('Bad request or server error: %s', response.status_code)
+            raise FritzBox.FbBadRequestException()
+        xml = etree().fromstring(response.text)
+        return xml.find('SID').text, int(xml.find('BlockTime').text)
+
+    def pbkdf2Response(self, challenge, fbpasswd):
+        import hashlib
+
+        _version, iter1, salt1, iter2, salt2 = challenge.split('$')
+        with span('pbkdf2'):
+            hash1 = self.pbkdf2Stage1(int(iter1), salt1, fbpasswd)
+            hash2 = hashlib.pbkdf2_hmac('sha256', hash1, salt2.decode('hex'), int(iter2))
+        return '%s$%s' % (salt2, hash2.encode('hex'))
+
+    def pbkdf2Stage1(self, iter1, salt1, fbpasswd):
+
+        # The key of the first stage only depends on the password and iter1/salt1, which are static per box. It is
+        # cached sealed (see tools.seal) with a fingerprint of the password, so a repeated login only computes the
+        # cheap second stage.
+
+        import hashlib
+
+        if isinstance(fbpasswd, unicode): fbpasswd = fbpasswd.encode('utf-8')
+        fingerprint = hashlib.sha256(secret() + fbpasswd).hexdigest()[:16]
+        cached = (unseal(state.get(self.setting('fb_stage1'))) or '').split('$')
+        if len(cached) == 4 and cached[:3] == [str(iter1), salt1, fingerprint]: return cached[3].decode('hex')
+
+        writeLog('Compute PBKDF2 key of the first stage (%s iterations)', iter1)
+        hash1 = hashlib.pbkdf2_hmac('sha256', fbpasswd, salt1.decode('hex'), iter1)
+        state.set(self.setting('fb_stage1'), seal('$'.join([str(iter1), salt1, fingerprint, hash1.encode('hex')])))
+        return hash1
+
+    def getFbUserRights(self, xml):
+
+        # get user permissions
+        if not self.established: return None
+        rl = list()
+        al = list()
+        rights = xml.find('Rights')
+        names = rights.findall('Name')
+        access = rights.findall('Access')
+        for name in names: rl.append(name.text)
+        for acc in access: al.append(acc.text)
+        writeLog(str(self.rights))
+        return dict(zip(rl, al))
+
+    def request(self, params, notify=True, retry=True):
+
+        # Send a request with the SID of the box to the Smart Home interface, returns the response or None on errors.
+        # If the SID isn't accepted anymore, log in again and retry once. While the circuit breaker is open, None is
+        # returned immediately.
+
+        import requests
+
+        if not self.breaker.allow():
+            writeLog('FritzBox %s unreachable, skip %s', self.__fbserver, params.get('switchcmd'))
+            return None
+
+        params = dict(params, sid=self.__fbSID)
+        try:
+            with span('http', params.get('switchcmd')):
+                response = self.session.get(self.base_url + '/webservices/homeautoswitch.lua', params=params, verify=False,
+                                            timeout=5)
+            if response.status_code == 403 and retry:
+                writeLog('SID %s rejected, log in again', params['sid'])
+                with self.loginLock:
+                    if self.__fbSID == params['sid']:
+                        self.established = False
+                        self.__fbSIDts = 0
+                    if not self.established and not self.login(): return None
+                return self.request(params, notify=notify, retry=False)
+            self.breaker.success()
+            response.raise_for_status()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError, TypeError), e:
+            if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)): self.breaker.failure()
+            writeLog('Bad request or timed out', level=xbmc.LOGERROR)
+            writeLog(str(e), level=xbmc.LOGERROR)
+            if notify: notifyOSD(addonName, LS(30014), xbmcgui.NOTIFICATION_ERROR, time=3000)
+            return None
+
+        self.touchSID()
+        return response
+
+
+class FritzBox:
+
+    '''
+    Smart Home devices of all FritzBoxes of the settings (see Box). The device lists of the boxes are
+    queried concurrently and merged into one list and one snapshot, commands are routed to the box of
+    the (qualified) AIN.
+    '''
+
+    class FbInvalidChallengeException(Exception):
+        pass
+
+    class FbBadRequestException(Exception):
+        pass
+
+    def __init__(self):
+        self.getSettings()
+        self.refreshLock = threading.Lock()
+        self.INVALID = Box.INVALID
+        self.snapshot = Snapshot(signature=self.__signature)
+
+    @property
+    def established(self):
+        return all(box.established for box in self.boxes)
+
+    def getSettings(self):
+        self.boxes = [Box(number) for number in range(1, MAX_BOXES + 1)
+                      if number == 1 or addon.getSetting('fbEnabled%s' % number).upper() == 'TRUE']
+        self.__prefAIN = addon.getSetting('preferredAIN')
+        self.__readonlyAIN = frozenset(_ain.strip() for _ain in addon.getSetting('readonlyAIN').split(',') if _ain.strip())
+        self.__deviceSets = dict()
+        for _set in addon.getSetting('deviceSets').split(';'):
+            if '=' in _set:
+                _name, _ains = _set.split('=', 1)
+                self.__deviceSets[_name.strip()] = [_ain.strip() for _ain in _ains.split(',') if _ain.strip()]
+        self.__unknownAIN = True if addon.getSetting('unknownAIN').upper() == 'TRUE' else False
+        self.__cacheTTL = int(addon.getSetting('cacheTTL') or '0')
+        self.__pollInterval = int(addon.getSetting('pollInterval') or '60')
+
+        # settings which have an effect on the device list, a snapshot made with other settings is invalid
+
+        self.__signature = '|'.join([box.signature for box in self.boxes] + [str(self.__unknownAIN)])
+
+    def route(self, ain):
+
+        # Returns the box of a qualified AIN and the AIN on that box, e.g. (box 2, '08761 0000001') for 08761 0000001@2
+
+        _ain, _sep, _number = ain.rpartition('@')
+        if _sep and _number.isdigit():
+            for box in self.boxes:
+                if box.number == int(_number): return box, _ain
+        return self.boxes[0], ain
+
+    def resetFbSession(self):
+        for box in self.boxes: box.resetFbSession()
+
+    def keepalive(self):
+        return all([box.keepalive() for box in self.boxes])
+
+
+    def get_actors(self, devtype=None, timestamp=None):
+
+        # Returns a list of Actor objects. A valid snapshot is fresh if the background service is running, if it is
+        # younger than the cache TTL or if it was published with the given timestamp (the widget is reloaded because
+        # the snapshot has changed). A stale snapshot is returned immediately and refreshed in background.
+        # Without a valid snapshot the device list is queried from the FritzBox.
+
+        if self.snapshot.isValid():
+            fresh = self.isFresh(timestamp)
+            if fresh or self.__cacheTTL > 0:
+                if not fresh:
+                    writeLog('Snapshot is %s seconds old, refresh in background', self.snapshot.age())
+                    threading.Thread(target=self.refresh).start()
+                with span('snapshot'):
+                    registry = self.registry()
+                    writeLog('Read %s devices from snapshot', len(registry))
+                    return registry.select(devtype)
+
+        registry = self.registry()
+        if registry is not None and any(box.breaker.isOpen() for box in self.boxes):
+
+            # a FritzBox was unreachable recently, show the last known state and probe in background
+
+            writeLog('FritzBox unreachable, use the last known state of %s devices', len(registry))
+            threading.Thread(target=self.refresh).start()
+            return registry.select(devtype)
+
+        fingerprints = dict()
+        actors = self.fetch_actors(fingerprints=fingerprints)
+        if actors is None: return list() if registry is None else registry.select(devtype)
+        fingerprints.pop('unchanged')
+        self.snapshot.publish([actor.to_dict() for actor in actors], notify=False, fingerprints=fingerprints)
+        return [actor for actor in actors if devtype is None or devtype == actor.type]
+
+    def getStale(self, actors):
+
+        # AINs of the actors whose FritzBox is unreachable, their state is the last known one
+
+        _boxes = [box for box in self.boxes if box.breaker.isOpen()]
+        return set(actor.actor_id for actor in actors if any(box.owns(actor.actor_id) for box in _boxes))
+
+    def isFresh(self, timestamp=None):
+
+        # A valid snapshot is fresh if the background service is running and has queried the device list within the
+        # last two poll intervals (polling pauses during video playback and while the screensaver is active), if it is
+        # younger than the cache TTL or if it was published with the given timestamp
+
+        _age = self.snapshot.age()
+        return self.snapshot.isValid() and ((self.snapshot.isServiceRunning() and _age < 2 * self.__pollInterval) or
+                                            _age < self.__cacheTTL or bool(timestamp and timestamp == str(self.snapshot.timestamp())))
+
+    def registry(self):
+
+        # Registry of the devices of the last snapshot (also of an invalidated one), None without snapshot
+
+        return self.snapshot.index(Registry)
+
+    def get_cached_actor(self, ain):
+
+        # Returns the Actor object of the given AIN from the last snapshot without querying the FritzBox
+
+        registry = self.registry()
+        return None if registry is None else registry.get(ain)
+
+    def get_actor(self, ain, fields=('tsoll',)):
+
+        # Returns the Actor object of the given AIN. The device of a fresh snapshot is returned without querying the
+        # FritzBox, otherwise the raw values in fields are queried with single device commands (see QUERIES) and the
+        # last known device is updated. A device which isn't in the registry is built from the queried values and its
+        # name. Returns the last known device (or None) if the FritzBox can't be queried.
+
+        actor = self.get_cached_actor(ain)
+        if actor is not None and self.isFresh(): return actor
+
+        values = self.query_actor(ain, fields if actor is not None else ('name',) + tuple(fields))
+        if values is None: return actor
+
+        if actor is None:
+            actor = Device.from_dict(dict(dict.fromkeys(Device.FIELDS), actor_id=ain, functionbitmask=0, present=1,
+                                          batterylow=0, is_group=GROUP_AIN.match(ain) is not None))
+
+            # function bits of the values the device has delivered
+
+            if values.get('tsoll') is not None: actor.functionbitmask |= Device.isThermostat
+            if values.get('switch_state') is not None: actor.functionbitmask |= Device.isPwrSwitch
+            if values.get('celsius') is not None: actor.functionbitmask |= Device.isTempSensor
+            if values.get('power_mw') is not None or values.get('energy_wh') is not None:
+                actor.functionbitmask |= Device.isPowerMeter
+        actor.update(**dict((field, value) for field, value in values.items() if value is not None or field not in ('name', 'present')))
+        return actor
+
+    def query_actor(self, ain, fields):
+
+        # Query raw values of a single device, returns a dictionary field: value (None if the device doesn't provide
+        # the value, e.g. 'inval') or None if the FritzBox can't be queried
+
+        box, _ain = self.route(ain)
+        if not box.connect(): return None
+
+        values = dict()
+        for field in fields:
+            response = box.request({'switchcmd': QUERIES[field], 'ain': _ain}, notify=False)
+            if response is None: return None
+            value = response.text.strip()
+            if field == 'name': values[field] = value or None
+            else: values[field] = int(value) if value.lstrip('-').isdigit() else None
+        writeLog('Queried values of %s: %s', ain, values)
+        return values
+
+    def refresh(self):
+
+        # Query the device list and publish it, the widget is reloaded by the skin if something has changed
+
+        with self.refreshLock:
+            fingerprints = dict()
+            actors = self.fetch_actors(fingerprints=fingerprints)
+            if actors is None: return None
+
+            # an unchanged device list isn't published again, the widget isn't reloaded
+
+            if fingerprints.pop('unchanged'): self.snapshot.touch()
+            else: self.snapshot.publish([actor.to_dict() for actor in actors], fingerprints=fingerprints)
+            return actors
+
+    def fetch_actors(self, devtype=None, fingerprints=None):
+
+        # Returns a list of Actor objects for querying SmartHome devices, None if no FritzBox can be queried. The device
+        # lists of several boxes are queried concurrently, the refresh takes as long as the slowest box. If a box
+        # can't be queried, its devices of the last snapshot are kept.
+        #
+        # The device lists are compared with the fingerprints of a valid snapshot, only changed devices are parsed.
+        # fingerprints (a dictionary) receives the fingerprints of the device lists to publish and 'unchanged', which is
+        # True if every box has returned the device list of the snapshot.
+
+        known = self.snapshot.fingerprints() if self.snapshot.isValid() else dict()
+        if len(self.boxes) == 1: results = [self.fetch_box(self.boxes[0], devtype, known)]
+        else: results = concurrently(lambda box: self.fetch_box(box, devtype, known), self.boxes)
+
+        if all(result is None for result in results): return None
+
+        merged = list()
+        lists = dict()
+        hashes = dict()
+        skipped = dict()
+        registry = self.registry()
+        for box, result in zip(self.boxes, results):
+            if result is None:
+                _actors = [actor for actor in (registry.select(devtype) if registry is not None else list()) if box.owns(actor.actor_id)]
+                writeLog('FritzBox %s not available, keep %s devices of the snapshot', box.number, len(_actors), level=xbmc.LOGWARNING)
+                hashes.update((actor.actor_id, known['devices'][actor.actor_id]) for actor in _actors
+                              if actor.actor_id in known.get('devices', dict()))
+                skipped.update((ain, _hash) for ain, _hash in known.get('skipped', dict()).items() if box.owns(ain))
+            else:
+                _actors, lists[str(box.number)], _hashes, _skipped = result
+                hashes.update(_hashes)
+                skipped.update(_skipped)
+            merged.extend(_actors)
+
+        if fingerprints is not None:
+            fingerprints.update({'lists': lists, 'devices': hashes, 'skipped': skipped, 'unchanged': lists == known.get('lists')})
+
+        if len(merged) == 0:
+            writeLog('no device list available', level=xbmc.LOGDEBUG)
+            notifyOSD(addonName, LS(30015))
+        return merged
+
+    def fetch_box(self, box, devtype=None, known=None):
+
+        # Returns the list of Actor objects of one box with qualified AINs, the fingerprint of its device list, the
+        # fingerprints of its devices and of the devices which were skipped as unknown, None if the box can't be
+        # queried. known are the fingerprints of the snapshot: the devices of an unchanged device list and of unchanged
+        # device elements are taken from the snapshot, unchanged unknown devices are skipped without parsing.
+
+        import hashlib
+        import requests
+        ET = etree()
+
+        if not box.connect(): return None
+
+        response = box.request({'switchcmd': 'getdevicelistinfos'})
+        if response is None: return None
+
+        known = known or dict()
+        _devices = known.get('devices', dict())
+        _skipped = known.get('skipped', dict())
+        registry = self.registry()
+        actors = list()
+        hashes = dict()
+        skipped = dict()
+        try:
+
+            # The device list is read completely before it's parsed (not streamed): its fingerprint decides whether
+            # anything has to be parsed at all, and a device list of a few hundred kB doesn't need incremental parsing.
+
+            raw = response.content
+            fingerprint = hashlib.md5(raw).hexdigest()
+            if registry is not None and known.get('lists', dict()).get(str(box.number)) == fingerprint:
+                writeLog('Device list of FritzBox %s unchanged', box.number)
+                actors = [actor for actor in registry.select(devtype) if box.owns(actor.actor_id)]
+                return actors, fingerprint, dict((actor.actor_id, _devices[actor.actor_id]) for actor in actors if actor.actor_id in _devices), \
+                    dict((ain, _hash) for ain, _hash in _skipped.items() if box.owns(ain))
+
+            _compact = isDebug() and addon.getSetting('compactLog').upper() == 'TRUE'
+            _parsed = _count = 0
+            with span('parse'):
+                for ain, element in splitdevices(raw):
+                    if ain is None: continue
+                    ain = box.qualify(ain)
+                    _hash = hashlib.md5(element).hexdigest()
+                    _count += 1
+
+                    # an unchanged element is the device of the snapshot, only the devices which are kept have a
+                    # fingerprint (they are in the snapshot)
+
+                    actor = None
+                    if registry is not None and _devices.get(ain) == _hash: actor = registry.get(ain)
+                    if actor is not None:
+                        if devtype is None or devtype == actor.type:
+                            actors.append(actor)
+                            hashes[ain] = _hash
+                        continue
+                    if _skipped.get(ain) == _hash:
+                        skipped[ain] = _hash
+                        continue
+
+                    actor = Device(ET.fromstring(element))
+                    _parsed += 1
+                    if devtype is not None and devtype != actor.type: continue
+
+                    if not self.__unknownAIN and actor.unknown:
+                        skipped[ain] = _hash
+                        continue
+
+                    actor.actor_id = ain
+                    actors.append(actor)
+                    hashes[ain] = _hash
+
+                    # the state of every changed device in one line of raw values or as block of display values, only
+                    # in debug mode
+
+                    if not isDebug(): continue
+                    if _compact:
+                        writeLog('%r', actor)
+                        continue
+
+                    writeLog('<<<<', level=xbmc.LOGDEBUG)
+                    writeLog('----- current state of AIN %s -----', actor.actor_id)
+                    writeLog('Name:          %s', actor.name)
+                    writeLog('Type:          %s', actor.type)
+                    writeLog('Presence:      %s', actor.present)
+                    writeLog('Device ID:     %s', actor.device_id)
+                    writeLog('Temperature:   %s', actor.temperature)
+                    writeLog('State:         %s', actor.state)
+                    writeLog('Icon:          %s', actor.icon)
+                    writeLog('Power:         %s', actor.power)
+                    writeLog('Consumption:   %s', actor.energy)
+                    writeLog('soll Temp.:    %s', actor.set_temp)
+                    writeLog('comfort Temp.: %s', actor.comf_temp)
+                    writeLog('lower Temp.:   %s', actor.lowering_temp)
+                    writeLog('Battery:       %s', actor.battery)
+                    writeLog('Battery low:   %s', actor.batterylow)
+                    writeLog('>>>>', level=xbmc.LOGDEBUG)
+            writeLog('Parsed %s of %s devices of FritzBox %s', _parsed, _count, box.number)
+        except (ET.ParseError, IOError, requests.exceptions.RequestException, requests.packages.urllib3.exceptions.HTTPError), e:
+            writeLog('Could not read device list: %s', str(e), level=xbmc.LOGERROR)
+            notifyOSD(addonName, LS(30014), xbmcgui.NOTIFICATION_ERROR, time=3000)
+            return None
+        return actors, fingerprint, hashes, skipped
+
+    def switch(self, cmd, ain=None, param=None, label=None, invalidate=True):
+
+        # invalidate: a set command invalidates the snapshot, unless the caller applies the result (see execute)
+
+        writeLog('Provided command: %s, ain: %s, param: %s, device: %s', cmd, ain, param, label)
+
+        # Call an actor method on the box of the AIN
+
+        box, _ain = self.route(ain or '')
+        if box.breaker.isBlocked():
+            writeLog('FritzBox %s unreachable, command %s not sent', box.number, cmd, level=xbmc.LOGWARNING)
+            notifyOSD(addonName, LS(30010), xbmcgui.NOTIFICATION_WARNING, time=3000)
+            return
+        if not box.connect(): return
+
+        params = {
+            'switchcmd': cmd,
+        }
+        if ain:
+
+            # check if readonly AIN
+
+            if self.isReadonly(ain):
+                notifyOSD(addonName, LS(30013), xbmcgui.NOTIFICATION_WARNING, time=3000)
+                return
+
+            params['ain'] = _ain
+
+        if cmd == 'sethkrtsoll':
+            import resources.lib.slider as Slider
+
+            slider = Slider.SliderWindow.createSliderWindow()
+            slider.label = LS(30035) % label
+            slider.initValue = (param - 16) * 100 / 40
+            slider.doModal()
+            slider.close()
+
+            _sliderBin = int(slider.retValue) * 2
+
+            writeLog('Thermostat binary before/now: %s/%s', param, _sliderBin)
+            del slider
+
+            if param == _sliderBin: return
+            else:
+                writeLog('set thermostat %s to %s', ain, _sliderBin)
+                param = str(_sliderBin)
+
+            if param: params['param'] = param
+
+        response = box.request(params)
+        if response is None: return None
+
+        # the device state has changed, don't use the snapshot until it is refreshed
+
+        if cmd.startswith('set') and invalidate: self.snapshot.invalidate()
+        return response.text.strip()
+
+    def execute(self, cmd, ain, param=None, label=None, debounce=0):
+
+        # Send cmd to ain (an AIN, a comma separated list of AINs or a device set) and publish the new device state.
+        # Rapidly repeated switch commands of a single device are merged within debounce (ms). Returns the result of
+        # the command (a dictionary with the result of every AIN for several devices), None if nothing was sent.
+
+        # a device set or a list of a single AIN is sent as command of that device
+
+        ains = self.getAINs(ain) or [ain]
+
+        if cmd in ('setswitchtoggle', 'setswitchon', 'setswitchoff') and debounce > 0 and len(ains) == 1:
+            from resources.lib.commandqueue import CommandQueue
+
+            cmd = CommandQueue(debounce).coalesce(ains[0], cmd)
+            if cmd is None: return None
+
+        # the results of the commands are applied to a valid snapshot (one write of the snapshot), the snapshot is
+        # invalidated and the device list is queried only if that fails
+
+        _valid = self.snapshot.isValid()
+
+        if cmd != 'sethkrtsoll' and len(ains) > 1:
+
+            # switch several devices at once, report the result in aggregate
+
+            results = self.switch_many(cmd, ains, invalidate=False)
+            _switched = len([result for result in results.values() if result is not None])
+            notifyOSD(addonName, LS(30053) % (_switched, len(results)),
+                      icon=xbmcgui.NOTIFICATION_INFO if _switched == len(results) else xbmcgui.NOTIFICATION_WARNING)
+            if _switched > 0 and not (_valid and self.apply(cmd, results)):
+                self.snapshot.invalidate()
+                self.refresh()
+            return results
+
+        result = self.switch(cmd, ain=ains[0], param=param, label=label, invalidate=False)
+        if result is not None:
+            writeLog('Last command on device %s was: %s', ains[0], cmd, level=xbmc.LOGDEBUG)
+
+            # publish the new device state, the widget reloads from the snapshot if the state has changed
+
+            if not (_valid and self.apply(cmd, {ains[0]: result})):
+                self.snapshot.invalidate()
+                self.refresh()
+        return result
+
+    def apply(self, cmd, results):
+
+        # Apply the results of switch commands (a dictionary AIN: response) to the snapshot: the new switch state (a
+        # switched off device consumes no power) or the new target temperature. The command of a group has also
+        # switched its members, they are changed alike. Returns False if a result can't be applied, e.g. of a group
+        # whose members aren't known.
+
+        registry = self.registry()
+        changes = dict()
+        for ain, result in results.items():
+            if result is None: continue
+            if not result.isdigit() or registry is None: return False
+
+            _devices = [ain]
+            if GROUP_AIN.match(ain) is not None or (ain in registry and registry.get(ain).is_group):
+                _devices.extend(member.actor_id for member in registry.members(ain))
+                if len(_devices) == 1: return False
+
+            for _ain in _devices:
+                if cmd == 'sethkrtsoll':
+                    changes[_ain] = {'tsoll': int(result)}
+                elif cmd in ('setswitchtoggle', 'setswitchon', 'setswitchoff'):
+                    changes[_ain] = {'switch_state': int(result)}
+                    actor = registry.get(_ain)
+                    if int(result) == 0 and actor is not None and actor.power_mw is not None: changes[_ain]['power_mw'] = 0
+                else:
+                    return False
+        return len(changes) > 0 and self.snapshot.patch(changes)
+
+    def isReadonly(self, ain):
+        return ain.strip() in self.__readonlyAIN
+
+    def getAINs(self, ain):
+
+        # Resolve the ain parameter, which may be the name of a device set or a comma separated list of AINs
+
+        if ain in self.__deviceSets: return self.__deviceSets[ain]
+        return [_ain.strip() for _ain in ain.split(',') if _ain.strip()]
+
+    def switch_many(self, cmd, ains, invalidate=True):
+
+        # Send a switch command to several devices concurrently, all requests share the session. Returns a
+        # dictionary with the result for each AIN, None if the device is readonly or the command has failed.
+        # invalidate as with switch.
+
+        results = dict((ain, None) for ain in ains)
+
+        def _switch(ain):
+            box, _ain = self.route(ain)
+            response = box.request({'switchcmd': cmd, 'ain': _ain}, notify=False)
+            return ain, None if response is None else response.text.strip()
+
+        _switchable = list()
+        for ain in ains:
+            if self.isReadonly(ain): writeLog('Skip readonly AIN %s', ain)
+            elif not self.route(ain)[0].connect(): writeLog('Skip AIN %s, no connection to its FritzBox', ain)
+            else: _switchable.append(ain)
+
+        if _switchable: results.update(concurrently(_switch, _switchable))
+
+        for ain in ains: writeLog('%s on device %s: %s', cmd, ain, results[ain])
+        if cmd.startswith('set') and invalidate and any(result is not None for result in results.values()): self.snapshot.invalidate()
+        return results
+
+    def get_device_stats(self, ain):
+
+        # Query getbasicdevicestats of a device, returns a dictionary with a list of series for each measurement
+        # (temperature, voltage, power, energy) or None. A series is (grid in seconds, time of the newest value or None,
+        # values), values are newest first and None if the device didn't deliver a value.
+
+        box, _ain = self.route(ain)
+        if not box.connect(): return None
+        response = box.request({'switchcmd': 'getbasicdevicestats', 'ain': _ain}, notify=False)
+        if response is None: return None
+
+        ET = etree()
+        try:
+            stats = dict()
+            for measurement in ET.fromstring(response.content):
+                stats[measurement.tag] = [(int(series.get('grid', '0')),
+                                           int(series.get('datatime')) if series.get('datatime') else None,
+                                           [None if value in ('', '-') else int(value) for value in (series.text or '').split(',')])
+                                          for series in measurement.findall('stats')]
+            return stats
+        except (ET.ParseError, ValueError), e:
+            writeLog('Could not read device statistics of %s: %s', ain, str(e), level=xbmc.LOGERROR)
+            return None
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from array import array
+from time import time
+
+from resources.lib.tools import *
+
+HISTORY_FOLDER = 'history'
+HISTORY_VERSION = 1
+
+# views of the history: name, bucket width (seconds) and number of buckets. Every view is a ring buffer of its own,
+# samples are aggregated into all views when they are added.
+
+VIEWS = (('day', 900, 96), ('week', 3600, 168), ('month', 86400, 31))
+
+# header: version, time and energy counter (Wh) of the last sample
+# bucket: bucket number (time / width), number of samples, sum, min. and max. of the power (W), energy (Wh)
+
+HEADER = 3
+FIELDS = 6
+
+
+class History(object):
+
+    '''
+    Power and energy history of the devices with a power meter. Every AIN has a file of fixed size in
+    the addon profile (an array of doubles), which holds a ring buffer of aggregated buckets for each
+    view, so memory and disk usage don't grow over time. Series and aggregates are read from the
+    buckets of a view, raw samples are never stored.
+
+    A sample changes the header and one bucket per view, only these are written to an existing file
+    (a few dozen bytes per poll instead of the whole file), a new file is written completely.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(addonFolder('profile'), HISTORY_FOLDER)
+        self.__buffers = dict()
+
+        # offsets of the changed buckets per AIN, None if the whole buffer has to be written
+
+        self.__dirty = dict()
+
+    def filename(self, ain):
+        return os.path.join(self.path, ''.join(c if c.isalnum() else '_' for c in ain) + '.bin')
+
+    def load(self, ain):
+        if ain not in self.__buffers:
+            _buffer = array('d')
+            _size = HEADER + FIELDS * sum(view[2] for view in VIEWS)
+            try:
+                with open(self.filename(ain), 'rb') as handle:
+                    _buffer.fromfile(handle, _size)
+            except (IOError, EOFError):
+                del _buffer[:]
+
+            # a new buffer or a buffer of another layout
+
+            self.__dirty[ain] = set()
+            if len(_buffer) != _size or _buffer[0] != HISTORY_VERSION:
+                _buffer = array('d', [0.0]) * _size
+                _buffer[0] = HISTORY_VERSION
+                _buffer[2] = -1
+                self.__dirty[ain] = None
+            self.__buffers[ain] = _buffer
+        return self.__buffers[ain]
+
+    def save(self, ain):
+        _buffer = self.load(ain)
+        _file = self.filename(ain)
+        _dirty = self.__dirty.get(ain)
+
+        if _dirty is not None and os.path.exists(_file):
+
+            # header and changed buckets in place
+
+            with open(_file, 'r+b') as handle:
+                for i, length in [(0, HEADER)] + [(i, FIELDS) for i in sorted(_dirty)]:
+                    handle.seek(i * _buffer.itemsize)
+                    _buffer[i:i + length].tofile(handle)
+        else:
+            try:
+                if not os.path.exists(self.path): os.makedirs(self.path)
+            except OSError:
+                pass
+            _tmp = tempName(_file)
+            with open(_tmp, 'wb') as handle:
+                _buffer.tofile(handle)
+            replaceFile(_tmp, _file)
+        self.__dirty[ain] = set()
+
+    def last(self, ain):
+
+        # time of the last sample of ain, 0 if there is none
+
+        return self.load(ain)[1]
+
+    def add(self, ain, ts, power, energy=None):
+
+        # Aggregate a sample into the buckets of all views, samples older than the last one are ignored.
+        # energy is the counter of the device (Wh), the consumption since the last sample is added to the bucket.
+
+        _buffer = self.load(ain)
+        if ts <= _buffer[1]: return False
+
+        _consumed = 0.0
+        if energy is not None:
+            if _buffer[2] >= 0 and energy >= _buffer[2]: _consumed = energy - _buffer[2]
+            _buffer[2] = energy
+        _buffer[1] = ts
+
+        _offset = HEADER
+        for name, width, buckets in VIEWS:
+            _bucket = int(ts // width)
+            i = _offset + FIELDS * (_bucket % buckets)
+            if self.__dirty[ain] is not None: self.__dirty[ain].add(i)
+            if _buffer[i] != _bucket or _buffer[i + 1] == 0:
+                _buffer[i:i + FIELDS] = array('d', [_bucket, 1, power, power, power, _consumed])
+            else:
+                _buffer[i + 1] += 1
+                _buffer[i + 2] += power
+                if power < _buffer[i + 3]: _buffer[i + 3] = power
+                if power > _buffer[i + 4]: _buffer[i + 4] = power
+                _buffer[i + 5] += _consumed
+            _offset += FIELDS * buckets
+        return True
+
+    def record(self, actors, ts=None):
+
+        # add the current power and energy of all devices with a power meter (see FritzBox.fetch_actors)
+
+        ts = ts or time()
+        for actor in actors:
+            if actor.has_powermeter and actor.power_mw is not None:
+                if self.add(actor.actor_id, ts, actor.power_mw / 1000.0, actor.energy_wh): self.save(actor.actor_id)
+
+    def backfill(self, ain, stats, ts=None):
+
+        # Add the power samples of getbasicdevicestats (see FritzBox.get_device_stats) which are newer than
+        # the last sample, e.g. after Kodi was shut down. Returns the number of added samples.
+
+        ts = ts or time()
+        if not stats or not stats.get('power'): return 0
+        grid, datatime, values = stats['power'][0]
+        datatime = datatime or ts
+
+        _added = 0
+        for n in range(len(values) - 1, -1, -1):
+            if values[n] is not None and self.add(ain, datatime - n * grid, values[n] / 100.0): _added += 1
+        if _added: self.save(ain)
+        return _added
+
+    def buckets(self, ain, view='day', ts=None):
+
+        # filled buckets of a view in chronological order, ending with the bucket of ts
+
+        _offset = HEADER
+        for name, width, buckets in VIEWS:
+            if name == view: break
+            _offset += FIELDS * buckets
+        else:
+            raise ValueError('unknown view: %s' % view)
+
+        _buffer = self.load(ain)
+        _last = int((ts or time()) // width)
+        for _bucket in range(_last - buckets + 1, _last + 1):
+            i = _offset + FIELDS * (_bucket % buckets)
+            if _buffer[i] == _bucket and _buffer[i + 1] > 0: yield width, _buffer[i:i + FIELDS]
+
+    def series(self, ain, view='day', ts=None):
+
+        # list of (start time, average, min., max. power, energy) of the buckets of a view
+
+        return [(int(b[0]) * width, b[2] / b[1], b[3], b[4], b[5]) for width, b in self.buckets(ain, view, ts)]
+
+    def aggregate(self, ain, view='day', ts=None):
+
+        # min., max. and average power and the consumed energy of a view, None if there are no samples
+
+        _count = _sum = _energy = 0.0
+        _min = _max = None
+        for width, b in self.buckets(ain, view, ts):
+            _count += b[1]
+            _sum += b[2]
+            _min = b[3] if _min is None else min(_min, b[3])
+            _max = b[4] if _max is None else max(_max, b[4])
+            _energy += b[5]
+        if _count == 0: return None
+        return {'min': _min, 'max': _max, 'avg': _sum / _count, 'energy': _energy, 'samples': int(_count)}
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import SocketServer
+import threading
+
+from resources.lib.tools import *
+
+PROP_IPC = 'fritzact.ipc'
+
+# actions which are forwarded to the service and their switch commands
+
+COMMANDS = {'toggle': 'setswitchtoggle', 'on': 'setswitchon', 'off': 'setswitchoff'}
+
+CONNECT_TIMEOUT = 0.5
+REPLY_TIMEOUT = 15
+MAX_REQUEST = 4096
+
+
+def forward(action, ain):
+
+    # Send an action to the command server of the service, returns the reply or None if no server is listening, the
+    # caller executes the action itself in that case. Once the request is sent, the action is never executed twice,
+    # errors are returned as reply.
+
+    address = xbmcgui.Window(10000).getProperty(PROP_IPC)
+    if not address: return None
+
+    import socket
+
+    port, token = address.split(':', 1)
+    try:
+        connection = socket.create_connection(('127.0.0.1', int(port)), CONNECT_TIMEOUT)
+    except (socket.error, ValueError) as e:
+        writeLog('Command server not reachable: %s', str(e))
+        return None
+
+    try:
+        connection.settimeout(REPLY_TIMEOUT)
+        connection.sendall(json.dumps({'token': token, 'action': action, 'ain': ain}) + '\n')
+        reply = connection.makefile('r').readline()
+        return json.loads(reply) if reply else {'ok': False, 'error': 'no reply'}
+    except (socket.error, ValueError) as e:
+        return {'ok': False, 'error': str(e)}
+    finally:
+        connection.close()
+
+
+class CommandHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST))
+        except ValueError:
+            return
+
+        if not isinstance(request, dict) or request.get('token') != self.server.token or \
+                request.get('action') not in COMMANDS or not request.get('ain'):
+            reply = {'ok': False, 'error': 'invalid request'}
+        else:
+            try:
+                reply = {'ok': True, 'result': self.server.execute(request['action'], request['ain'])}
+            except Exception as e:
+                writeLog('Command %s on %s failed: %s', request['action'], request['ain'], str(e), level=xbmc.LOGERROR)
+                reply = {'ok': False, 'error': str(e)}
+        self.wfile.write(json.dumps(reply) + '\n')
+
+
+class CommandServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+
+    '''
+    Loopback server of the service, which executes the switch actions of RunScript calls in the resident
+    process with its established session. Port and a random token are published in the Window(10000)
+    property fritzact.ipc, so only Kodi scripts can send commands. execute(action, ain) is called in a
+    thread of its own for every request.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, execute):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', 0), CommandHandler)
+        self.execute = execute
+        self.token = os.urandom(16).encode('hex')
+        self.window = xbmcgui.Window(10000)
+
+    def start(self):
+        _thread = threading.Thread(target=self.serve_forever)
+        _thread.daemon = True
+        _thread.start()
+        self.window.setProperty(PROP_IPC, '%s:%s' % (self.server_address[1], self.token))
+        writeLog('Command server listening on port %s', self.server_address[1])
+        return self
+
+    def stop(self):
+        self.window.clearProperty(PROP_IPC)
+        self.shutdown()
+        self.server_close()
+        writeLog('Command server stopped')
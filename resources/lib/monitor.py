@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import heapq
+import threading
+from time import time
+
+from resources.lib.tools import *
+
+PROP_MONITOR = 'fritzact.monitor.%s'
+
+# the interval is reset to the fastest one if the power changes by more than CHANGE (relative) and at least CHANGE_MIN
+# (mW), otherwise it is doubled up to the slowest one
+
+CHANGE = 0.05
+CHANGE_MIN = 1000
+
+# no device is queried more often than every MIN_INTERVAL seconds, whatever the settings are
+
+MIN_INTERVAL = 2
+
+
+class Watch(object):
+
+    # Sampling state of a monitored device
+
+    __slots__ = ('ain', 'interval', 'due', 'power', 'above', 'started', 'energy', 'idle')
+
+    def __init__(self, ain, interval):
+        self.ain = ain
+        self.interval = interval
+        self.due = 0
+        self.power = None
+        self.above = False
+        self.started = None
+        self.energy = None
+        self.idle = None
+
+    def __lt__(self, other):
+        return self.due < other.due
+
+
+class PowerMonitor(object):
+
+    '''
+    Live power of the devices of the setting monitorAIN, sampled with getswitchpower and getswitchenergy
+    in one thread of the service with its session. The interval of a device adapts to its power: the
+    fastest interval while the power changes, doubled with every flat sample (or while the device is
+    off) up to the slowest interval. A heap of the due times keeps the loop at one wakeup per sample,
+    so the cost per device is two requests per interval.
+
+    The power (W) of every device is published in the Window(10000) property fritzact.monitor.<AIN>.
+    notifyOSD reports when the power exceeds the threshold of the settings and when a cycle (e.g. of
+    a washing machine) has finished: the power was above the idle power and has stayed below it for
+    the idle time.
+    '''
+
+    def __init__(self, getFritz):
+
+        # getFritz returns the FritzBox of the service, it's called for every sample as the service replaces the
+        # FritzBox when the settings change
+
+        self.getFritz = getFritz
+        self.window = xbmcgui.Window(10000)
+        self.watches = dict()
+        self.queue = list()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.running = False
+        self.getSettings()
+
+    def getSettings(self):
+        self.fastest = max(MIN_INTERVAL, int(addon.getSetting('monitorFastest') or '5'))
+        self.slowest = max(self.fastest, int(addon.getSetting('monitorSlowest') or '60'))
+        self.threshold = int(addon.getSetting('monitorThreshold') or '0') * 1000
+        self.idlePower = int(addon.getSetting('monitorIdle') or '5') * 1000
+        self.idleTime = int(addon.getSetting('monitorIdleTime') or '180')
+
+        ains = [_ain.strip() for _ain in addon.getSetting('monitorAIN').split(',') if _ain.strip()]
+        with self.lock:
+            for ain in set(self.watches) - set(ains):
+                self.window.clearProperty(PROP_MONITOR % ain)
+                del self.watches[ain]
+            for ain in ains:
+                if ain not in self.watches: self.watches[ain] = Watch(ain, self.fastest)
+            self.queue = list(self.watches.values())
+            for watch in self.queue: watch.due = 0
+            heapq.heapify(self.queue)
+        if ains: writeLog('Monitor power of %s', ', '.join(ains))
+        self.wakeup.set()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='monitor')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None: self.thread.join()
+        for ain in self.watches: self.window.clearProperty(PROP_MONITOR % ain)
+
+    def run(self):
+        while self.running:
+            with self.lock:
+                watch = self.queue[0] if self.queue else None
+                delay = None if watch is None else watch.due - time()
+                if watch is not None and delay <= 0: heapq.heappop(self.queue)
+
+            # sleep until the next device is due or the settings change
+
+            if watch is None or delay > 0:
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+                continue
+
+            self.sample(watch)
+            with self.lock:
+                if self.watches.get(watch.ain) is watch and watch not in self.queue:
+                    watch.due = time() + watch.interval
+                    heapq.heappush(self.queue, watch)
+
+    def sample(self, watch):
+        values = self.getFritz().query_actor(watch.ain, ('power_mw', 'energy_wh'))
+        if values is None or values['power_mw'] is None:
+
+            # the FritzBox can't be queried or the device doesn't measure power, try again with the slowest interval
+
+            watch.interval = self.slowest
+            return
+
+        power, energy = values['power_mw'], values['energy_wh']
+        watch.interval = self.adapt(watch, power)
+        watch.power = power
+        self.window.setProperty(PROP_MONITOR % watch.ain, '{:0.1f}'.format(power / 1000.0))
+        self.check(watch, power, energy)
+
+    def adapt(self, watch, power):
+
+        # The next interval of a device after a sample of power (mW). While a cycle is running, its end is noticed
+        # within a third of the idle time.
+
+        _slowest = self.slowest if watch.started is None else max(self.fastest, min(self.slowest, self.idleTime // 3))
+        if power == 0: return _slowest
+        if watch.power is None or abs(power - watch.power) > max(CHANGE_MIN, CHANGE * watch.power): return self.fastest
+        return min(_slowest, watch.interval * 2)
+
+    def check(self, watch, power, energy):
+        now = time()
+
+        if self.threshold > 0:
+            if power > self.threshold and not watch.above:
+                watch.above = True
+                notifyOSD(addonName, LS(30070) % (self.getName(watch.ain), '{:0.1f}'.format(power / 1000.0)), xbmcgui.NOTIFICATION_WARNING)
+            elif power < self.threshold * 0.9:
+                watch.above = False
+
+        # a cycle starts above the idle power and finishes after the idle time below it
+
+        if power >= self.idlePower:
+            if watch.started is None:
+                writeLog('Cycle of %s started, %s mW', watch.ain, power)
+                watch.started, watch.energy = now, energy
+            watch.idle = None
+        elif watch.started is not None:
+            if watch.idle is None: watch.idle = now
+            if now - watch.idle >= self.idleTime:
+                _energy = 0 if energy is None or watch.energy is None else energy - watch.energy
+                writeLog('Cycle of %s finished after %s seconds, %s Wh', watch.ain, int(watch.idle - watch.started), _energy)
+                notifyOSD(addonName, LS(30071) % (self.getName(watch.ain), int(watch.idle - watch.started) // 60, _energy))
+                watch.started = watch.energy = watch.idle = None
+
+    def getName(self, ain):
+        actor = self.getFritz().get_cached_actor(ain)
+        return ain if actor is None or not actor.name else actor.name
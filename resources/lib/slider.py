@@ -37,7 +37,7 @@ class SliderWindow(BaseWindow):
 
     def onAction(self, action):
 
-        t.writeLog('Action received: ID %s' % str(action.getId()))
+        t.writeLog('Action received: ID %s', str(action.getId()))
         val = None
         if (action == ACTION_PREVIOUS_MENU) or  (action == ACTION_NAV_BACK) or (action == ACTION_SELECT):
             self.close()
@@ -72,7 +72,7 @@ class SliderWindow(BaseWindow):
         if val is not None:
             self.getControl(SliderWindow.SLIDER_ID).setPercent(val)
             self.curValue = val
-            t.writeLog('set slider value to %s percent' % (val))
+            t.writeLog('set slider value to %s percent', val)
 
         self.retValue = (self.getControl(SliderWindow.SLIDER_ID).getPercent() * 20.0) / 100 + 8
         self.getControl(SliderWindow.SLIDERVAL_ID).setLabel('{:0.1f}'.format(self.retValue) + ' °C'.decode('utf-8'))
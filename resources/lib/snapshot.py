@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+from time import time
+
+from resources.lib.tools import *
+
+SNAPSHOT_FILE = 'devices.json'
+SNAPSHOT_VERSION = 3
+
+PROP_TIMESTAMP = 'fritzact.timestamp'
+PROP_SERVICE = 'fritzact.service'
+PROP_CHECKED = 'fritzact.checked'
+
+
+class Snapshot(object):
+
+    '''
+    Device state as published by the background service or after a switch command. The parsed device
+    list is stored as JSON in the addon profile, the Home window (10000) carries the timestamp of the
+    last change and a flag if the service is running, so the script and the widget can skip the network.
+
+    The timestamp is part of the content path of the widget, so the skin reloads the widget only if
+    the published device state has changed.
+
+    The fingerprints of the raw device lists and of every device element are kept with the devices,
+    so a poll which returns the same device list doesn't parse and publish it again (see touch).
+    '''
+
+    def __init__(self, path=None, signature=None):
+
+        # signature identifies the settings the snapshot was made with, a snapshot of other settings is invalid
+
+        self.path = path or os.path.join(addonFolder('profile'), SNAPSHOT_FILE)
+        self.signature = signature
+        self.window = xbmcgui.Window(10000)
+        self.__data = None
+        self.__index = None
+        self.__mtime = None
+
+    def isServiceRunning(self):
+        return self.window.getProperty(PROP_SERVICE) == 'true'
+
+    def setServiceRunning(self, running):
+        if running: self.window.setProperty(PROP_SERVICE, 'true')
+        else: self.window.clearProperty(PROP_SERVICE)
+
+    def publish(self, devices, notify=True, checked=None, fingerprints=None):
+
+        # devices is a list of dictionaries (see Device.to_dict). Returns True if the device state has changed.
+        # The timestamp property is only touched if the state has changed and notify is set. checked is the time the
+        # device list was queried from the FritzBox (now by default). fingerprints are the hashes of the raw device
+        # lists per FritzBox ('lists'), of the device elements per AIN ('devices') the devices were parsed from and of
+        # the elements which were skipped as unknown devices ('skipped').
+
+        import hashlib
+
+        digest = hashlib.md5(json.dumps(devices, sort_keys=True)).hexdigest()
+        previous = self.read(reload=True)
+        changed = previous is None or previous.get('digest') != digest
+
+        ts = int(time())
+        if not changed:
+            writeLog('Device state unchanged since %s', previous['timestamp'])
+            ts = previous['timestamp']
+        elif previous is not None and ts <= previous['timestamp']:
+            ts = previous['timestamp'] + 1
+
+        self.write({'version': SNAPSHOT_VERSION, 'timestamp': ts, 'checked': int(time()) if checked is None else checked, 'valid': True, 'signature': self.signature,
+                    'digest': digest, 'fingerprints': fingerprints or dict(), 'devices': devices})
+
+        if changed:
+            writeLog('Publish snapshot of %s devices, timestamp: %s', len(devices), ts)
+            if notify: self.window.setProperty(PROP_TIMESTAMP, str(ts))
+        return changed
+
+    def patch(self, changes):
+
+        # Apply the changed raw values of single devices (a dictionary AIN: dictionary of values, e.g. the result of a
+        # switch command) to the snapshot and publish it without querying the device list. The time of the last query
+        # is kept, so the snapshot is reconciled with the next poll of the service or when the cache TTL expires.
+        # Returns False if a device isn't in the snapshot, the caller has to query the device list then.
+
+        data = self.read(reload=True)
+        if data is None: return False
+
+        devices = [dict(device) for device in data['devices']]
+        _patched = set()
+        for device in devices:
+            if device['actor_id'] in changes:
+                device.update(changes[device['actor_id']])
+                _patched.add(device['actor_id'])
+        if len(_patched) < len(changes): return False
+
+        # the patched devices don't match their device elements any more, the next device list is parsed again
+
+        fingerprints = data.get('fingerprints', dict())
+        fingerprints = {'lists': dict(), 'devices': dict((ain, fingerprint) for ain, fingerprint in fingerprints.get('devices', dict()).items()
+                                                         if ain not in _patched), 'skipped': fingerprints.get('skipped', dict())}
+
+        writeLog('Patch snapshot: %s', changes)
+        self.publish(devices, checked=data.get('checked', data['timestamp']), fingerprints=fingerprints)
+        return True
+
+    def touch(self):
+
+        # The device list was queried and is unchanged, only the time of the query is updated. It's kept in a property
+        # instead of the file, so an unchanged poll doesn't serialize the devices again.
+
+        self.window.setProperty(PROP_CHECKED, str(int(time())))
+
+    def invalidate(self):
+
+        # Keep the devices as last known state, but force a new query with the next request
+
+        data = self.read(reload=True)
+        if data is not None and data.get('valid', True):
+            writeLog('Invalidate snapshot')
+            data['valid'] = False
+            self.write(data)
+
+    def write(self, data):
+        self.__data = data
+        if not os.path.exists(os.path.dirname(self.path)): os.makedirs(os.path.dirname(self.path))
+        _tmp = tempName(self.path)
+
+        # json.dump encodes in Python, json.dumps with the C encoder
+
+        with open(_tmp, 'w') as handle:
+            handle.write(json.dumps(data))
+        replaceFile(_tmp, self.path)
+        self.__mtime = os.path.getmtime(self.path)
+
+    def read(self, reload=False):
+        if self.__data is None or reload:
+            self.__data = self.__mtime = None
+            try:
+                self.__mtime = os.path.getmtime(self.path)
+                with open(self.path, 'r') as handle:
+                    self.__data = json.load(handle)
+            except (IOError, OSError, ValueError) as e:
+                writeLog('Could not read snapshot: %s', str(e))
+
+            # snapshots of other versions have another layout of the device attributes
+
+            if self.__data is not None and self.__data.get('version') != SNAPSHOT_VERSION: self.__data = None
+        return self.__data
+
+    def isChanged(self):
+
+        # True if the file was written by another process (or Snapshot) since it was read
+
+        try:
+            return os.path.getmtime(self.path) != self.__mtime
+        except OSError:
+            return self.__mtime is not None
+
+    def isValid(self):
+        data = self.read()
+        return data is not None and data.get('valid', True) and data.get('signature') == self.signature
+
+    def checked(self):
+
+        # time the device list was queried from the FritzBox last
+
+        data = self.read()
+        if data is None: return None
+        try:
+            touched = int(self.window.getProperty(PROP_CHECKED))
+        except ValueError:
+            touched = 0
+        return max(data.get('checked', data['timestamp']), touched)
+
+    def age(self):
+
+        # seconds since the device list was queried from the FritzBox
+
+        checked = self.checked()
+        return None if checked is None else int(time()) - checked
+
+    def timestamp(self):
+        data = self.read()
+        return None if data is None else data['timestamp']
+
+    def fingerprints(self):
+        data = self.read()
+        return dict() if data is None else data.get('fingerprints', dict())
+
+    def load(self):
+        data = self.read()
+        return None if data is None else data['devices']
+
+    def index(self, build):
+
+        # Index of the devices (e.g. the Registry of the FritzBox module), build is called with the devices once per
+        # read or write of the snapshot. Returns None without snapshot.
+
+        data = self.read()
+        if data is None: return None
+        if self.__index is None or self.__index[0] is not data: self.__index = (data, build(data['devices']))
+        return self.__index[1]
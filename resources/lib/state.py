@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+
+from resources.lib.tools import *
+
+STATE_FILE = 'state.json'
+
+
+class State(object):
+
+    '''
+    Runtime data of the addon (session IDs, the time they were validated, sealed credentials material)
+    in a JSON file of the addon profile. Kodi rewrites the whole settings.xml with every setSetting,
+    the state file is small, written atomically (temporary file and rename) and only if a value has
+    changed. The settings keep what the user has set up.
+
+    Keys which aren't in the state file yet are read from the settings, where former versions of the
+    addon kept them.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.__data = None
+
+    def read(self):
+        if self.path is None: self.path = os.path.join(addonFolder('profile'), STATE_FILE)
+        try:
+            with open(self.path, 'r') as handle:
+                return json.load(handle)
+        except (IOError, ValueError):
+            return dict()
+
+    def get(self, key, default=''):
+        if self.__data is None: self.__data = self.read()
+        if key not in self.__data: return addon.getSetting(key) or default
+        return self.__data[key]
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def update(self, values):
+
+        # Write the changed values, the file is read again before, so values written by other scripts or the
+        # service in the meantime are kept
+
+        with self.lock:
+            if self.__data is None: self.__data = self.read()
+            if all(key in self.__data and self.__data[key] == value for key, value in values.items()): return False
+
+            self.__data = self.read()
+            self.__data.update(values)
+            if not os.path.exists(os.path.dirname(self.path)): os.makedirs(os.path.dirname(self.path))
+            _tmp = tempName(self.path)
+            with open(_tmp, 'w') as handle:
+                json.dump(self.__data, handle, sort_keys=True)
+            replaceFile(_tmp, self.path)
+            return True
+
+
+# the runtime data of the running script or service
+
+state = State()
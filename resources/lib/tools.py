@@ -5,41 +5,156 @@ import xbmc
 import xbmcgui
 import xbmcaddon
 import os
-import random
 import urllib
 
 addon = xbmcaddon.Addon()
 addonID = addon.getAddonInfo('id')
 addonVersion = addon.getAddonInfo('version')
-addonPath = xbmc.translatePath(addon.getAddonInfo('path'))
 addonName = addon.getAddonInfo('name')
-addonImages = os.path.join(xbmc.translatePath(addonPath), 'resources', 'lib', 'media')
 LS = addon.getLocalizedString
-IconDefault = os.path.join(addonPath, 'resources', 'lib', 'media', 'default.png')
 
+_folders = dict()
+
+
+# addon folders are resolved on first use, kind is 'path' (installation) or 'profile' (user data)
+
+def addonFolder(kind='path'):
+    if kind not in _folders: _folders[kind] = xbmc.translatePath(addon.getAddonInfo(kind))
+    return _folders[kind]
+
+
+def addonImage(image):
+    return os.path.join(addonFolder('path'), 'resources', 'lib', 'media', image)
+
+
+def tempName(path):
+
+    # temporary file next to path, unique per process and thread, so concurrent writers of path don't share it
+
+    import threading
+    return '%s.%s.%s.tmp' % (path, os.getpid(), threading.current_thread().ident)
+
+
+def replaceFile(source, target):
+
+    # Replace target with source in one step, readers see either the old or the new file. os.rename doesn't replace
+    # existing files on Windows, the target is removed there before.
+
+    try:
+        os.rename(source, target)
+    except OSError:
+        if os.path.exists(target): os.remove(target)
+        os.rename(source, target)
+
+
+# Credentials (the password, the cached login key) are sealed with a random secret of the installation, which is kept
+# in a file of the addon profile readable by the owner only. The settings hold a random nonce, the MAC and the data
+# encrypted with a SHA-256 key stream, not the key itself.
+
+SECRET_FILE = '.secret'
+SECRET_SIZE = 32
+SEALED = 'sealed'
+
+_secret = list()
+
+
+def secret():
+
+    # The secret is created by the first instance only (the service and the widget start at the same time), the
+    # others read it. A secret which is shorter than SECRET_SIZE is being written, it's read again.
+
+    if not _secret:
+        import errno
+        import time
+
+        path = os.path.join(addonFolder('profile'), SECRET_FILE)
+        data = ''
+        for n in range(100):
+            try:
+                with open(path, 'rb') as handle:
+                    data = handle.read()
+                if len(data) >= SECRET_SIZE: break
+            except IOError:
+                try:
+                    if not os.path.exists(addonFolder('profile')): os.makedirs(addonFolder('profile'))
+                except OSError:
+                    pass
+                try:
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+                except OSError as e:
+                    if e.errno != errno.EEXIST: raise
+                    continue
+                data = os.urandom(SECRET_SIZE)
+                with os.fdopen(fd, 'wb') as handle:
+                    handle.write(data)
+                break
+            time.sleep(0.01)
+        _secret.append(data)
+    return _secret[0]
+
+
+def _keystream(nonce, length):
+    import hashlib
+
+    return ''.join(hashlib.sha256(secret() + nonce + str(block)).digest() for block in range(length // 32 + 1))[:length]
+
+
+def seal(data):
+    import hmac
+    import hashlib
+
+    nonce = os.urandom(16)
+    sealed = ''.join(chr(ord(c) ^ ord(k)) for c, k in zip(data, _keystream(nonce, len(data))))
+    mac = hmac.new(secret(), nonce + sealed, hashlib.sha256).digest()[:16]
+    return (nonce + mac + sealed).encode('hex')
+
+
+def unseal(token):
+
+    # Returns the sealed data or None if the token is damaged or was sealed with another secret
+
+    import hmac
+    import hashlib
+
+    try:
+        token = token.decode('hex')
+    except (TypeError, ValueError):
+        return None
+    nonce, mac, sealed = token[:16], token[16:32], token[32:]
+    if len(mac) < 16 or hmac.new(secret(), nonce + sealed, hashlib.sha256).digest()[:16] != mac: return None
+    return ''.join(chr(ord(c) ^ ord(k)) for c, k in zip(sealed, _keystream(nonce, len(sealed))))
 
-# de-/encrypt passwords, simple algorithm, but prevent for sniffers and script kiddies
 
 def crypter(pw, key, token):
+
+    # Returns the password of the setting pw. A newly entered password is sealed into token of the state file (see
+    # resources/lib/state.py) and replaced by '*' in the settings, key marks the scheme. Passwords of the former XOR
+    # scheme (the key stored next to the token in the settings) are sealed on first use.
+
+    from resources.lib.state import state
+
     _pw = addon.getSetting(pw)
+    _former = False
     if _pw == '' or _pw == '*':
-        _key = addon.getSetting(key)
-        _token = addon.getSetting(token)
-        if len(_key) > 2: return "".join([chr(ord(_token[i]) ^ ord(_key[i])) for i in range(int(_key[-2:]))])
-        return ''
-    else:
-        _key = ''
-        for d in range((len(pw) / 16) + 1):
-            _key += ('%016d' % int(random.random() * 10 ** 16))
-        _key = _key[:-2] + ('%02d' % len(_pw))
-        _tpw = _pw.ljust(len(_key), 'a')
-        _token = "".join([chr(ord(_tpw[i]) ^ ord(_key[i])) for i in range(len(_key))])
-
-        addon.setSetting(key, _key)
-        addon.setSetting(token, _token)
-        addon.setSetting(pw, '*')
-
-        return _pw
+        _key = state.get(key)
+        _token = state.get(token)
+        if _key == SEALED:
+            _pw = unseal(_token)
+            if _pw is None: writeLog('Could not unseal %s, enter the password again', pw, level=xbmc.LOGERROR)
+            return _pw or ''
+        if len(_key) <= 2: return ''
+        _pw = "".join([chr(ord(_token[i]) ^ ord(_key[i])) for i in range(int(_key[-2:]))])
+        _former = True
+
+    state.update({key: SEALED, token: seal(_pw)})
+
+    # remove the token of the former scheme from the settings, after the sealed one is written
+
+    if _former:
+        addon.setSetting(key, '')
+        addon.setSetting(token, '')
+    if addon.getSetting(pw) != '*': addon.setSetting(pw, '*')
+    return _pw
 
 # get parameter hash, convert into parameter/value pairs, return dictionary
 
@@ -53,9 +168,24 @@ def paramsToDict(parameters):
                 paramDict[paramSplits[0]] = paramSplits[1]
     return paramDict
 
-# write log messages
+# Kodi writes debug messages only if debug logging is enabled, the state is checked once per script run (the service
+# refreshes it every poll)
+
+_debug = None
+
+
+def isDebug(refresh=False):
+    global _debug
+    if _debug is None or refresh: _debug = bool(xbmc.getCondVisibility('System.GetBool(debug.showloginfo)'))
+    return _debug
+
+# write log messages, args are formatted into the message only if the message is written:
+# writeLog('Device %s switched to %s', ain, state, level=xbmc.LOGDEBUG)
 
-def writeLog(message, level=xbmc.LOGDEBUG):
+def writeLog(message, *args, **kwargs):
+    level = kwargs.get('level', xbmc.LOGDEBUG)
+    if level == xbmc.LOGDEBUG and not isDebug(): return
+    if args: message = message % args
     try:
         xbmc.log('[%s %s] %s' % (addonID, addonVersion, message.encode('utf-8')), level)
     except UnicodeDecodeError:
@@ -63,5 +193,6 @@ def writeLog(message, level=xbmc.LOGDEBUG):
 
 # OSD notification (DialogKaiToast)
 
-def notifyOSD(header, message, icon=IconDefault, time=5000):
+def notifyOSD(header, message, icon=None, time=5000):
+    if icon is None: icon = addonImage('default.png')
     xbmcgui.Dialog().notification(header.encode('utf-8'), message.encode('utf-8'), icon, time)
\ No newline at end of file
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+from time import time
+
+from resources.lib.tools import *
+
+TRACE_FILE = 'trace.jsonl'
+TRACE_MAX_SIZE = 256 * 1024
+
+# number of recent durations per phase the percentiles are computed from
+
+TRACE_SAMPLES = 50
+
+PROP_TRACE = 'fritzact.trace.%s.%s'
+
+
+class NoSpan(object):
+
+    # span of a disabled tracer, does nothing
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class Span(object):
+
+    __slots__ = ('tracer', 'phase', 'start')
+
+    def __init__(self, tracer, phase, detail=None):
+        self.tracer = tracer
+        self.phase = phase if detail is None else '%s.%s' % (phase, detail)
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.record(self.phase, self.start, time() - self.start)
+        return False
+
+
+class Tracer(object):
+
+    '''
+    Timing of the phases of a script run or a poll of the service (login, HTTP requests, parsing, list
+    items ...). Spans are collected in memory and written by flush as JSON lines to the trace file in
+    the addon profile, which is rotated at TRACE_MAX_SIZE. The recent durations of every phase are kept
+    in Window(10000) properties, the skin can show the median and the 95th percentile:
+
+        Window(Home).Property(fritzact.trace.<phase>.p50)
+        Window(Home).Property(fritzact.trace.<phase>.p95)
+
+    Without the setting 'trace' span returns a shared object which does nothing.
+    '''
+
+    NOSPAN = NoSpan()
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(addonFolder('profile'), TRACE_FILE)
+        self.enabled = True if addon.getSetting('trace').upper() == 'TRUE' else False
+        self.spans = list()
+
+    def span(self, phase, detail=None):
+
+        # context manager which records the duration of phase, detail (e.g. the switch command) is appended to the
+        # name of the phase
+
+        if not self.enabled: return self.NOSPAN
+        return Span(self, phase, detail)
+
+    def record(self, phase, start, duration):
+        if self.enabled: self.spans.append((phase, start, duration))
+
+    def flush(self, context=None):
+
+        # write the collected spans and publish the percentiles, context (e.g. the action) is added to every span
+
+        if not self.enabled or not self.spans: return
+        spans, self.spans = self.spans, list()
+
+        window = xbmcgui.Window(10000)
+        durations = dict()
+        lines = list()
+        for phase, start, duration in spans:
+            lines.append(json.dumps({'ts': round(start, 3), 'phase': phase, 'ms': round(duration * 1000, 2),
+                                     'pid': os.getpid(), 'context': context}))
+            durations.setdefault(phase, list()).append(duration * 1000)
+
+        for phase, values in durations.items():
+            _recent = [float(value) for value in window.getProperty(PROP_TRACE % (phase, 'samples')).split(',') if value]
+            _recent = (_recent + values)[-TRACE_SAMPLES:]
+            window.setProperty(PROP_TRACE % (phase, 'samples'), ','.join('%.2f' % value for value in _recent))
+            _recent.sort()
+            window.setProperty(PROP_TRACE % (phase, 'p50'), '%.1f' % _recent[(len(_recent) - 1) // 2])
+            window.setProperty(PROP_TRACE % (phase, 'p95'), '%.1f' % _recent[int(round(0.95 * (len(_recent) - 1)))])
+
+        try:
+            if not os.path.exists(os.path.dirname(self.path)): os.makedirs(os.path.dirname(self.path))
+            if os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_MAX_SIZE:
+                if os.path.exists(self.path + '.1'): os.remove(self.path + '.1')
+                os.rename(self.path, self.path + '.1')
+            with open(self.path, 'a') as handle:
+                handle.write('\n'.join(lines) + '\n')
+        except (IOError, OSError) as e:
+            writeLog('Could not write trace: %s', str(e), level=xbmc.LOGERROR)
+
+
+# the tracer of the running script or service
+
+tracer = Tracer()
+span = tracer.span
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from resources.lib.tools import *
+from resources.lib.fritzbox import FritzBox, MAX_BOXES
+from resources.lib.snapshot import Snapshot
+from resources.lib.history import History
+from resources.lib.trace import tracer, span
+from resources.lib.ipc import CommandServer, COMMANDS
+from resources.lib.breaker import CircuitBreaker
+from resources.lib.monitor import PowerMonitor
+from resources.lib.exporter import MetricsServer
+
+import socket
+import threading
+from time import time
+
+# settings made by the user, all other settings (e.g. the SID) are runtime data
+
+USER_SETTINGS = ['fbServer', 'fbUsername', 'fbPasswd', 'fbTLS', 'readonlyAIN', 'unknownAIN', 'deviceSets',
+                 'serviceEnabled', 'pollInterval', 'cacheTTL'] + \
+                ['%s%s' % (setting, number) for number in range(2, MAX_BOXES + 1)
+                 for setting in ['fbEnabled', 'fbServer', 'fbUsername', 'fbPasswd', 'fbTLS']]
+
+
+class Player(xbmc.Player):
+
+    # calls stopped when the playback stops or ends
+
+    def __init__(self, stopped):
+        xbmc.Player.__init__(self)
+        self.stopped = stopped
+
+    def onPlayBackStopped(self):
+        self.stopped()
+
+    def onPlayBackEnded(self):
+        self.stopped()
+
+
+class FritzService(xbmc.Monitor):
+
+    '''
+    Keeps the FritzBox sessions alive and publishes the device list periodically as snapshot (see
+    resources/lib/snapshot.py). Polling is paused during video playback and while the screensaver
+    is active, the device list is queried at once when they end. The power and energy of every poll is added to the history (resources/lib/history.py),
+    gaps (e.g. while polling was paused) are filled from the statistics of the FritzBox.
+
+    Switch actions of RunScript calls are forwarded to the command server of the service (see
+    resources/lib/ipc.py) and sent with the session of the service. The live power of the monitored
+    devices is sampled by the power monitor (resources/lib/monitor.py) in a thread of the service.
+    External scrapers read the snapshot from the metrics server (resources/lib/exporter.py).
+    '''
+
+    def __init__(self):
+        xbmc.Monitor.__init__(self)
+        self.wakeup = threading.Event()
+        self.player = Player(self.wakeup.set)
+        self.fritz = None
+        self.lock = threading.Lock()
+        self.server = None
+        self.monitor = None
+        self.exporter = None
+        self.snapshot = Snapshot()
+        self.history = History()
+        self.backfilled = dict()
+        self.getSettings()
+
+    def getSettings(self):
+        self.settings = [addon.getSetting(setting) for setting in USER_SETTINGS]
+        self.enabled = True if addon.getSetting('serviceEnabled').upper() == 'TRUE' else False
+        self.interval = int(addon.getSetting('pollInterval') or '60')
+        self.recordHistory = True if addon.getSetting('history').upper() == 'TRUE' else False
+        tracer.enabled = True if addon.getSetting('trace').upper() == 'TRUE' else False
+        self.forwarding = True if addon.getSetting('forwardCommands').upper() == 'TRUE' else False
+        self.metrics = True if addon.getSetting('metrics').upper() == 'TRUE' else False
+        self.metricsPort = int(addon.getSetting('metricsPort') or '9472')
+        self.metricsExternal = True if addon.getSetting('metricsExternal').upper() == 'TRUE' else False
+
+    def onSettingsChanged(self):
+        _settings = self.settings
+        self.getSettings()
+        self.updateServer()
+        if self.monitor is not None: self.monitor.getSettings()
+        self.updateMonitor()
+        self.updateExporter()
+        if self.settings == _settings: return
+
+        writeLog('Settings changed, reconnect to FritzBox')
+        self.snapshot.invalidate()
+        for number in range(1, MAX_BOXES + 1): CircuitBreaker(number).reset()
+        self.fritz = None
+
+    def getFritz(self):
+        with self.lock:
+            if self.fritz is None: self.fritz = FritzBox()
+            return self.fritz
+
+    def updateServer(self):
+
+        # run the command server as long as the service and the forwarding of commands are enabled
+
+        if self.enabled and self.forwarding and self.server is None:
+            self.server = CommandServer(self.execute).start()
+        elif not (self.enabled and self.forwarding) and self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def updateMonitor(self):
+
+        # run the power monitor as long as the service is enabled, it's idle without monitored devices
+
+        if self.enabled and self.monitor is None:
+            self.monitor = PowerMonitor(self.getFritz).start()
+        elif not self.enabled and self.monitor is not None:
+            self.monitor.stop()
+            self.monitor = None
+
+    def updateExporter(self):
+
+        # run the metrics server as long as the service and the metrics are enabled, another port restarts it
+
+        _address = (self.metricsPort, self.metricsExternal) if self.enabled and self.metrics else None
+        if self.exporter is not None and (self.exporter.port, self.exporter.external) != _address:
+            self.exporter.stop()
+            self.exporter = None
+        if _address is not None and self.exporter is None:
+            try:
+                self.exporter = MetricsServer(self.getFritz, *_address).start()
+            except socket.error as e:
+                writeLog('Metrics server not started on port %s: %s', self.metricsPort, str(e), level=xbmc.LOGERROR)
+
+    def execute(self, action, ain):
+
+        # switch action of a RunScript call, called by the command server
+
+        writeLog('Forwarded action %s on %s', action, ain)
+        return self.getFritz().execute(COMMANDS[action], ain, debounce=int(addon.getSetting('debounce') or '0'))
+
+    def onScreensaverDeactivated(self):
+        self.wakeup.set()
+
+    def isPaused(self):
+        return self.player.isPlayingVideo() or xbmc.getCondVisibility('System.ScreenSaverActive')
+
+    def poll(self):
+        fritz = self.getFritz()
+        isDebug(refresh=True)
+
+        with span('poll'):
+            actors = fritz.refresh()
+            if actors is not None:
+                self.snapshot.setServiceRunning(True)
+                if self.recordHistory: self.addHistory(actors)
+        tracer.flush('service')
+
+    def addHistory(self, actors):
+        _now = time()
+        for actor in actors:
+            if not actor.has_powermeter or not actor.present or actor.power_mw is None: continue
+
+            # more than two poll intervals since the last sample, fill the gap with the samples of the FritzBox. The
+            # time of the attempt is kept, the statistics are queried once per gap even if they don't add samples.
+
+            if _now - max(self.history.last(actor.actor_id), self.backfilled.get(actor.actor_id, 0)) > 2 * self.interval:
+                self.backfilled[actor.actor_id] = _now
+                _added = self.history.backfill(actor.actor_id, self.getFritz().get_device_stats(actor.actor_id), _now)
+                writeLog('Added %s samples from statistics to the history of %s', _added, actor.actor_id)
+        self.history.record(actors, _now)
+
+    def run(self):
+        writeLog('Service started, refresh interval %s seconds', self.interval)
+        self.updateServer()
+        self.updateMonitor()
+        self.updateExporter()
+        try:
+            while not self.abortRequested():
+
+                # an error of a poll (e.g. an unexpected answer of the FritzBox) doesn't stop the service
+
+                try:
+                    if self.enabled and not self.isPaused():
+                        self.poll()
+                    elif self.enabled and self.fritz is not None:
+                        self.fritz.keepalive()
+                    elif not self.enabled:
+                        self.snapshot.setServiceRunning(False)
+                except Exception:
+                    import traceback
+                    writeLog('Poll failed: %s', traceback.format_exc(), level=xbmc.LOGERROR)
+
+                if self.wait(): break
+        finally:
+            self.enabled = False
+            self.updateServer()
+            self.updateMonitor()
+            self.updateExporter()
+            self.snapshot.setServiceRunning(False)
+            writeLog('Service finished')
+
+    def wait(self):
+
+        # Wait for the poll interval, a poll is due at once when the screensaver or the playback ends. Returns True if
+        # Kodi is quitting.
+
+        _until = time() + self.interval
+        while time() < _until and not self.wakeup.is_set():
+            if self.waitForAbort(max(0.1, min(1, _until - time()))): return True
+        self.wakeup.clear()
+        return False
+
+
+if __name__ == '__main__':
+    FritzService().run()